@@ -1,20 +1,31 @@
 import json
+import os
 from PIL import Image
 
 import ee
 import streamlit as st
 from streamlit_folium import st_folium
-from shapely import Polygon
+from shapely.geometry import shape
 
-from soils_revealed.maps import MapGEE
+from soils_revealed.backends import EEGroupedReducerBackend, LocalZarrBackend, SummedAreaBackend, select_backend
+from soils_revealed.chunk_cache import ChunkCacheConfig
+from soils_revealed.maps import GEELayer, MapGEE
+from soils_revealed.masks import geometry_key, is_rectangle
 from soils_revealed.data_params import GEEData, read_ds
-from soils_revealed.processing import get_data, get_plot
+from soils_revealed.integral import SummedAreaIndex
+from soils_revealed.processing import render_plot
+from soils_revealed.result_cache import get_result_cache, grid_key
 from soils_revealed.verification import selected_bbox_too_large, selected_bbox_in_boundary
 
 MAP_CENTER = [-2.2, 113.8]
 MAP_ZOOM = 10
-MAX_ALLOWED_AREA_SIZE = 20.0
+MAX_ALLOWED_AREA_KM2 = 2_500_000.0
+# Sum total t C (pixel values weighted by their area) instead of t C/ha
+AREA_WEIGHTED = False
 FILENAME = 'data/land-cover.pkl'
+INDEX_PATH = 'data/soc-change-index.zarr'
+CHUNK_CACHE = ChunkCacheConfig(memory_bytes=512 * 2 ** 20, disk_path='data/chunk-cache', disk_bytes=8 * 2 ** 30)
+RESULT_CACHE_PATH = 'data/result-cache'
 BTN_LABEL = "Submit"
 
 # Initialize GEE
@@ -32,7 +43,19 @@ for dataset in ['SOC-Stock-Change', 'Global-Land-Cover']:
     datasets[dataset] = GEEData(dataset)
 
 # Read data
-ds = read_ds(access_key_id=st.secrets["S3_ACCESS_KEY_ID"], secret_accsess_key=st.secrets["S3_SECRET_ACCESS_KEY"])
+ds = read_ds(access_key_id=st.secrets["S3_ACCESS_KEY_ID"], secret_accsess_key=st.secrets["S3_SECRET_ACCESS_KEY"],
+             cache=CHUNK_CACHE)
+
+# Compute backends: summed-area table index (built with `python -m soils_revealed.integral`),
+# local zarr reduction and Earth Engine grouped reducer
+# (the index only holds unweighted sums)
+index_backend = SummedAreaBackend(SummedAreaIndex(INDEX_PATH)) \
+    if os.path.exists(INDEX_PATH) and not AREA_WEIGHTED else None
+local_backend = LocalZarrBackend(ds, area_weighted=AREA_WEIGHTED)
+remote_backend = EEGroupedReducerBackend(area_weighted=AREA_WEIGHTED)
+
+# Submit results shared by all sessions of this process
+result_cache = get_result_cache(disk_path=RESULT_CACHE_PATH)
 
 
 # Create the Streamlit app and define the main code:
@@ -47,19 +70,21 @@ def main():
 
     m = MapGEE(center=MAP_CENTER, zoom=MAP_ZOOM)
 
-    # Add layers
-    m.add_gee_layer(
+    # Add layers (map ids are resolved concurrently and cached across reruns)
+    layers = [GEELayer(
         image=datasets['SOC-Stock-Change'].ee_image(),
         sld_interval=datasets['SOC-Stock-Change'].sld_interval(),
         name=f'SOC Stock Change (2000 - 2018)'
-    )
+    )]
 
     for year in ['2000', '2018']:
-        m.add_gee_layer(
+        layers.append(GEELayer(
             image=datasets['Global-Land-Cover'].ee_image(year=year),
             sld_interval=datasets['Global-Land-Cover'].sld_interval(),
             name=f'Global Land Cover ({year})'
-        )
+        ))
+
+    m.add_gee_layers(layers)
 
     m.add_layer_control()
 
@@ -88,7 +113,7 @@ def main():
         st.markdown(
             f"""
                         1. Click the black square on the map
-                        2. Draw a rectangle on the map
+                        2. Draw a rectangle or a polygon on the map
                         3. Click on <kbd>{BTN_LABEL}</kbd>
                         4. Wait for the computation to finish
                         """,
@@ -103,7 +128,7 @@ def main():
         ):
             # Check if the geometry is valid
             geometry = geojson['geometry']
-            if selected_bbox_too_large(geometry, threshold=MAX_ALLOWED_AREA_SIZE):
+            if selected_bbox_too_large(geometry, threshold=MAX_ALLOWED_AREA_KM2, units='km2', ds=ds):
                 st.sidebar.warning(
                     "Selected region is too large, fetching data for this area would consume too many resources. "
                     "Please select a smaller region."
@@ -115,23 +140,31 @@ def main():
                     "Ensure to use the initial center view of the world for drawing your rectangle."
                 )
             else:
-                # Create a Shapely polygon from the coordinates
-                poly = Polygon(geojson['geometry']['coordinates'][0])
+                # Create a Shapely polygon from the geometry
+                poly = shape(geometry)
                 # Get the bbox coordinates using the bounds() method
                 xmin, ymin, xmax, ymax = poly.bounds
-
-                # Data analysis
-                ds_eg = ds.sel(x=slice(xmin, xmax), y=slice(ymax, ymin)).copy()
-
-                # Generate the data required for the plot
-                data = get_data(ds_eg)
-
-                # Generate the plot using Matplotlib
-                plot = get_plot(data)
+                # Rectangles take the bbox path, other polygons are rasterized into a pixel mask
+                rectangle = is_rectangle(poly)
+
+                # Reuse the result of any rectangle covering the same pixels, or of the same polygon
+                key = grid_key(ds, (xmin, ymin, xmax, ymax)) if rectangle else geometry_key(poly)
+                key = (key, AREA_WEIGHTED)
+                result = result_cache.get(key)
+                if result is None:
+                    # Generate the data required for the plot with the backend best suited to the bbox size
+                    backend = select_backend((xmin, ymin, xmax, ymax), local=local_backend,
+                                             remote=remote_backend, index=index_backend, polygon=not rectangle)
+                    data = backend.get_data((xmin, ymin, xmax, ymax)) if rectangle else \
+                        backend.get_data_geometry(geometry)
+
+                    # Render the plot using Matplotlib (cached by data)
+                    result = {'data': data, 'figure': render_plot(data, units='t C' if AREA_WEIGHTED else 't C/ha')}
+                    result_cache.set(key, result)
 
                 # Display the plot using Streamlit
                 text_container.subheader("SOC stock change by land cover")
-                plot_container.pyplot(plot)
+                plot_container.image(result['figure'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import os
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from soils_revealed.data_params import NO_GROUP, GEEData
+
+# Land cover codes with a group, as found in the real store
+CODES = np.flatnonzero(GEEData('Global-Land-Cover').class_metadata().code_to_group != NO_GROUP).astype(np.uint8)
+
+TIMES = pd.to_datetime(['2000-12-31', '2018-12-31']).as_unit('ns')
+
+
+def synthetic_ds(ny, nx, chunks=512, seed=0, changed=0.3, resolution=0.0025):
+    """
+    Lazy dataset shaped like `read_ds`: float32 `stocks` and uint8 `land-cover` over (time, y, x).
+
+    Parameters:
+    ny, nx (int): Grid size.
+    chunks (int): Chunk size along y and x.
+    seed (int): Random seed.
+    changed (float): Fraction of pixels whose land cover changes between 2000 and 2018.
+    resolution (float): Pixel size in degrees, the grid starts at (0, 0) and goes south-east.
+    """
+    rng = da.random.RandomState(seed)
+    shape, block = (ny, nx), (chunks, chunks)
+
+    stocks_2000 = rng.normal(50., 15., size=shape, chunks=block).astype(np.float32)
+    stocks_2018 = stocks_2000 + rng.normal(0., 2., size=shape, chunks=block).astype(np.float32)
+    lc_2000 = rng.randint(0, CODES.size, size=shape, chunks=block).map_blocks(CODES.take, dtype=np.uint8)
+    lc_2018 = da.where(rng.random_sample(size=shape, chunks=block) < changed,
+                       rng.randint(0, CODES.size, size=shape, chunks=block).map_blocks(CODES.take, dtype=np.uint8),
+                       lc_2000)
+
+    return xr.Dataset({'stocks': (('time', 'y', 'x'), da.stack([stocks_2000, stocks_2018])),
+                       'land-cover': (('time', 'y', 'x'), da.stack([lc_2000, lc_2018]))},
+                      coords={'time': TIMES,
+                              'y': -(np.arange(ny) + .5) * resolution,
+                              'x': (np.arange(nx) + .5) * resolution})
+
+
+def write_fixture(store, ny, nx, chunks=512, seed=0, **kwargs):
+    """
+    Write `synthetic_ds` to a zarr store, one chunk per time step as in the S3 stores, and open it lazily.
+    """
+    ds = synthetic_ds(ny, nx, chunks=chunks, seed=seed, **kwargs).chunk({'time': 1, 'y': chunks, 'x': chunks})
+    ds.to_zarr(store, mode='w', consolidated=True)
+
+    return xr.open_zarr(store, consolidated=True)
+
+
+def write_source_stores(root, ny, nx, chunks=512, land_cover_chunks=None, n_times=19, seed=0, **kwargs):
+    """
+    Write local copies of the two S3 stores joined by `data_params.read_joined_ds`.
+
+    `{root}/global-dataset.zarr` holds the `recent` group: yearly `stocks` over `n_times` years and a
+    `depth` dimension, `{root}/land-cover.zarr` the 2000 and 2018 land cover. The land cover may be
+    chunked differently from the stocks, as on S3.
+
+    The years run from 2000, the last one is always 2018 when `n_times` < 19 so that `read_joined_ds`
+    finds both years it selects.
+    """
+    if n_times < 2:
+        raise ValueError(f"n_times must be at least 2 for the 2000 and 2018 stocks, got {n_times}.")
+
+    ds = synthetic_ds(ny, nx, chunks=chunks, seed=seed, **kwargs)
+    years = np.union1d(2000 + np.arange(n_times - 1), [2000 + max(n_times - 1, 18)])
+    times = pd.to_datetime([f'{year}-12-31' for year in years]).as_unit('ns')
+
+    # Linear trajectory through the 2000 and 2018 stocks
+    weights = xr.DataArray((years - 2000) / 18., dims='time', coords={'time': times})
+    stocks_2000, stocks_2018 = ds['stocks'].isel(time=0, drop=True), ds['stocks'].isel(time=1, drop=True)
+    stocks = (stocks_2000 + (stocks_2018 - stocks_2000) * weights).astype(np.float32).transpose('time', 'y', 'x')
+
+    recent = xr.Dataset({'stocks': stocks,
+                         'depth_bnds': (('depth', 'nv'), np.array([[0., 30.]]))},
+                        coords={'depth': ['0-30']})
+    recent.chunk({'time': 1, 'y': chunks, 'x': chunks}).to_zarr(os.path.join(root, 'global-dataset.zarr'),
+                                                                group='recent', mode='w', consolidated=True)
+
+    land_cover_chunks = land_cover_chunks or chunks
+    ds[['land-cover']].chunk({'time': 1, 'y': land_cover_chunks, 'x': land_cover_chunks}).to_zarr(
+        os.path.join(root, 'land-cover.zarr'), mode='w', consolidated=True)
+
+
+class LocalProvider:
+    """
+    Stand-in for `data_params.DatasetProvider` opening the stores written by `write_source_stores`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def open_zarr(self, dataset, group=None):
+        return xr.open_zarr(os.path.join(self.root, f'{dataset}.zarr'), group=group, consolidated=True)
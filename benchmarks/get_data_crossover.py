@@ -0,0 +1,58 @@
+"""
+Where `get_data` should switch from the numpy path to the chunked reduction.
+
+    python -m benchmarks.get_data_crossover --size 8192 --chunks 512
+
+Both paths are timed on square selections of growing side from a local synthetic zarr
+store. `processing.NUMPY_MAX_PIXELS` should sit around the reported crossover.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import write_fixture
+from soils_revealed.processing import NUMPY_MAX_PIXELS, get_data, get_data_chunked
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the numpy and chunked get_data paths by selection size.")
+    parser.add_argument('--size', type=int, default=8192, help="Side of the synthetic grid, in pixels.")
+    parser.add_argument('--chunks', type=int, default=512, help="Chunk size of the synthetic store.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timings per measure, the best one is kept.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ds = write_fixture(os.path.join(tmp, 'fixture.zarr'), args.size, args.size, chunks=args.chunks)
+
+        sides = sorted({int(side) for side in np.geomspace(64, args.size, 10)})
+        # Smallest selection from which the chunked path stays faster
+        crossover = None
+        print(f"{'side':>6} {'pixels':>11} {'numpy (s)':>10} {'chunked (s)':>12}")
+        for side in sides:
+            selection = ds.isel(y=slice(0, side), x=slice(0, side))
+            numpy_seconds = best_of(lambda: get_data(selection, max_numpy_pixels=np.inf), args.repeat)
+            chunked_seconds = best_of(lambda: get_data_chunked(selection), args.repeat)
+            if chunked_seconds >= numpy_seconds:
+                crossover = None
+            elif crossover is None:
+                crossover = side * side
+            print(f"{side:>6} {side * side:>11} {numpy_seconds:>10.4f} {chunked_seconds:>12.4f}")
+
+    print(f"crossover: {crossover} pixels (NUMPY_MAX_PIXELS = {NUMPY_MAX_PIXELS})")
+
+
+if __name__ == "__main__":
+    main()
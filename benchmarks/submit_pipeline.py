@@ -0,0 +1,178 @@
+"""
+Latency and peak memory of the Submit pipeline on local synthetic stores, no S3 credentials needed.
+
+    python -m benchmarks.submit_pipeline --sizes 4096 8192 --chunks 512 --sides 256 1024 4096 \\
+        --output results.json [--compare previous.json]
+
+Every stage is timed separately, keeping the best of `--repeat` runs:
+
+- open: join the `global-dataset`/`land-cover` stores as `read_ds` does (`data_params.read_joined_ds`)
+- select: `ds.sel` of a square bbox at the center of the grid
+- load: read the selected pixels into memory
+- reduce: `processing.get_data` of the loaded selection
+- render: draw the plot and save it to PNG
+
+Peak memory is measured with tracemalloc in one more run, so it does not slow the timed ones.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import dask
+import numpy as np
+import xarray as xr
+import zarr
+
+from benchmarks.fixtures import LocalProvider, write_source_stores
+from soils_revealed.data_params import read_joined_ds
+from soils_revealed.processing import get_data, get_plot
+
+STAGES = ['open', 'select', 'load', 'reduce', 'render']
+
+
+def run_stages(root, bbox):
+    """
+    Run the pipeline once, yielding (stage, result) as every stage ends.
+    """
+    ds = read_joined_ds(LocalProvider(root))
+    yield 'open', ds
+
+    xmin, ymin, xmax, ymax = bbox
+    ds = ds.sel(x=slice(xmin, xmax), y=slice(ymax, ymin))
+    yield 'select', ds
+
+    ds = ds[['stocks', 'land-cover']].load()
+    yield 'load', ds
+
+    data = get_data(ds)
+    yield 'reduce', data
+
+    buffer = io.BytesIO()
+    get_plot(data).savefig(buffer, format='png', bbox_inches='tight')
+    yield 'render', buffer
+
+
+def time_stages(root, bbox):
+    seconds = {}
+    start = time.perf_counter()
+    for stage, _ in run_stages(root, bbox):
+        seconds[stage] = time.perf_counter() - start
+        start = time.perf_counter()
+
+    return seconds
+
+
+def peak_memory(root, bbox):
+    """
+    Peak bytes allocated above the start of every stage.
+    """
+    peaks = {}
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for stage, _ in run_stages(root, bbox):
+            _, peak = tracemalloc.get_traced_memory()
+            peaks[stage] = peak - start
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peaks
+
+
+def center_bbox(size, side, resolution=0.0025):
+    # Square of `side` pixels at the center of the fixture grid, which starts at (0, 0) and goes south-east
+    start = (size - side) // 2
+    low, high = start * resolution, (start + side) * resolution
+
+    return low, -high, high, -low
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = {(r['size'], r['chunks'], r['land_cover_chunks'], r['side']): r for r in json.load(f)['results']}
+
+    print(f"\nCompared with {previous_path} (time ratio, > 1 is slower):")
+    for result in results:
+        before = previous.get((result['size'], result['chunks'], result['land_cover_chunks'], result['side']))
+        if before is None:
+            continue
+        ratios = '  '.join(f"{stage} {result['seconds'][stage] / before['seconds'][stage]:.2f}" for stage in STAGES
+                           if before['seconds'].get(stage))
+        print(f"{result['size']:>6} {result['chunks']:>6} {result['side']:>6}  {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Submit pipeline on synthetic zarr stores.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4096], help="Sides of the synthetic grids.")
+    parser.add_argument('--chunks', type=int, nargs='+', default=[512], help="Chunk sizes of the stocks.")
+    parser.add_argument('--land-cover-chunks', type=int, default=None,
+                        help="Chunk size of the land cover, same as the stocks by default.")
+    parser.add_argument('--sides', type=int, nargs='+', default=[256, 1024, 4096],
+                        help="Sides of the selected bboxes, in pixels.")
+    parser.add_argument('--times', type=int, default=19,
+                        help="Number of yearly stocks in the global dataset, 2000 and 2018 always among them.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case, the best one is kept.")
+    parser.add_argument('--workdir', default=None, help="Keep the synthetic stores there to reuse them across runs.")
+    parser.add_argument('--output', default='benchmark-results.json', help="JSON file of the results.")
+    parser.add_argument('--compare', default=None, help="Results of a previous run to compare with.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        results = []
+        for size in args.sizes:
+            for chunks in args.chunks:
+                land_cover_chunks = args.land_cover_chunks or chunks
+                root = os.path.join(workdir, f'soils-revealed-{size}-{chunks}-{land_cover_chunks}-{args.times}')
+                if not os.path.exists(os.path.join(root, 'land-cover.zarr')):
+                    write_source_stores(root, size, size, chunks=chunks, land_cover_chunks=land_cover_chunks,
+                                        n_times=args.times)
+
+                for side in [side for side in args.sides if side <= size]:
+                    bbox = center_bbox(size, side)
+                    runs = [time_stages(root, bbox) for _ in range(args.repeat)]
+                    seconds = {stage: min(run[stage] for run in runs) for stage in STAGES}
+                    result = {'size': size, 'chunks': chunks, 'land_cover_chunks': land_cover_chunks, 'side': side,
+                              'pixels': side * side, 'seconds': seconds, 'peak_bytes': peak_memory(root, bbox)}
+                    results.append(result)
+
+                    print(f"{size:>6} {chunks:>6} {side:>6}  " +
+                          '  '.join(f"{stage} {seconds[stage]:.3f}s" for stage in STAGES) +
+                          f"  peak {max(result['peak_bytes'].values()) / 2 ** 20:.0f} MiB")
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'versions': {module.__name__: module.__version__ for module in (np, xr, dask, zarr)},
+        'config': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import logging
+import os
+
+import dask
+import numpy as np
+import s3fs
+from numcodecs import Blosc
+
+from soils_revealed.data_params import ANALYSIS_READY_DATASET, get_provider, read_joined_ds
+
+log = logging.getLogger(__name__)
+
+# LZ4 decompresses several times faster than the default zstd/zlib at a similar ratio on these arrays
+COMPRESSOR = Blosc(cname='lz4', clevel=5, shuffle=Blosc.SHUFFLE)
+
+
+def encoding(chunks=1024, stocks_scale=None):
+    """
+    Zarr encoding of the analysis-ready variables.
+
+    Parameters:
+    chunks (int): Chunk size along y and x, both years share every chunk.
+    stocks_scale (float): Store stocks as int16 multiples of this value (e.g. 0.01 t C/ha) instead of float32.
+    """
+    stocks = {'dtype': 'float32'}
+    if stocks_scale:
+        stocks = {'dtype': 'int16', 'scale_factor': stocks_scale, '_FillValue': np.iinfo(np.int16).min}
+
+    return {
+        'stocks': {**stocks, 'chunks': (2, chunks, chunks), 'compressor': COMPRESSOR},
+        # 0 is the 'No Data' class
+        'land-cover': {'dtype': 'uint8', 'chunks': (2, chunks, chunks), 'compressor': COMPRESSOR},
+    }
+
+
+def check_stocks_range(stocks, stocks_scale):
+    """
+    Raise ValueError if `stocks` does not fit in int16 multiples of `stocks_scale`, whose cast would wrap around.
+
+    The int16 minimum is left out, it is the fill value of missing stocks.
+    """
+    low, high = (float(value) for value in dask.compute(stocks.min(), stocks.max()))
+    info = np.iinfo(np.int16)
+    if np.round(low / stocks_scale) <= info.min or np.round(high / stocks_scale) > info.max:
+        raise ValueError(f"Stocks between {low} and {high} do not fit in int16 multiples of {stocks_scale}, "
+                         f"[{(info.min + 1) * stocks_scale}, {info.max * stocks_scale}]. "
+                         f"Use a larger scale or float32 stocks.")
+
+
+def build_store(ds, store, chunks=1024, stocks_scale=None):
+    """
+    Write the 2000 and 2018 stocks and land cover into one co-chunked, compactly typed zarr store.
+
+    Parameters:
+    ds (xr.Dataset): Joined dataset, see `data_params.read_joined_ds`.
+    store: Zarr store or path to write.
+    chunks (int): Chunk size along y and x.
+    stocks_scale (float): See `encoding`. Raises ValueError if the stocks do not fit, see `check_stocks_range`.
+    """
+    ds = ds[['stocks', 'land-cover']].transpose('time', 'y', 'x')
+    if stocks_scale:
+        check_stocks_range(ds['stocks'], stocks_scale)
+    ds['land-cover'] = ds['land-cover'].fillna(0)
+
+    # Dask chunks aligned with the zarr chunks, every task writes whole chunks
+    ds = ds.chunk({'time': -1, 'y': chunks, 'x': chunks})
+    for name in ds.variables:
+        ds[name].encoding = {}
+
+    log.info(f"💾  writing {dict(ds.sizes)} with {chunks}x{chunks} chunks")
+    ds.to_zarr(store, mode='w', encoding=encoding(chunks=chunks, stocks_scale=stocks_scale), consolidated=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the analysis-ready zarr store opened by `read_ds`.")
+    parser.add_argument('--output', default=None, help="Path of the store to write, defaults to "
+                                                       f"s3://soils-revealed/{ANALYSIS_READY_DATASET}.zarr.")
+    parser.add_argument('--chunks', type=int, default=1024, help="Chunk size along y and x.")
+    parser.add_argument('--stocks-scale', type=float, default=None,
+                        help="Store stocks as int16 multiples of this value instead of float32.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    provider = get_provider(access_key_id=os.environ['S3_ACCESS_KEY_ID'],
+                            secret_accsess_key=os.environ['S3_SECRET_ACCESS_KEY'])
+
+    store = args.output
+    if store is None:
+        store = s3fs.S3Map(root=f's3://soils-revealed/{ANALYSIS_READY_DATASET}.zarr', s3=provider.s3, check=False)
+
+    build_store(read_joined_ds(provider), store, chunks=args.chunks, stocks_scale=args.stocks_scale)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,42 @@
 import io
-import time
+import itertools
+import logging
+import os
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import ee
 import numpy as np
-from shapely.geometry import shape
 
 from data_params import SatelliteImageryData
+from tasks import ExportTaskMonitor
+
+log = logging.getLogger(__name__)
+
+FETCH_WORKERS = 8
+FETCH_RETRIES = 3
+FETCH_TIMEOUT = 120
+
+
+def http_session(pool_size=FETCH_WORKERS, retries=FETCH_RETRIES):
+    """
+    Pooled HTTP session retrying failed thumbnail requests with exponential backoff.
+    """
+    retry = Retry(total=retries, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
 
 
 class Animation:
@@ -76,7 +105,8 @@ class Animation:
         return images
     
 
-    def export_images_as_geotiffs(self, geometry, start_year, stop_year, folder, dimensions=None):
+    def export_images_as_geotiffs(self, geometry, start_year, stop_year, folder, dimensions=None, max_running=4,
+                                  progress_callback=None, backend=None):
         """
         Export video as GeoTIFF.
         ----------
@@ -89,8 +119,12 @@ class Animation:
             If only one number is passed, it is used as the maximum, and the other dimension is computed by proportional scaling.
         folder : str
             Path to the Drive folder to save the GeoTIFFs
-        alpha_channel : Boolean
-            If True adds transparency
+        max_running : int
+            Maximum number of export tasks running at the same time
+        progress_callback : callable
+            Called with a tasks.ExportProgress after every status poll. Prints the status by default
+        backend : object
+            Task backend, defaults to tasks.EETaskBackend
         """
         # Area of Interest
         region = geometry.get('features')[0].get('geometry').get('coordinates')
@@ -112,37 +146,50 @@ class Animation:
                 task = ee.batch.Export.image.toDrive(image=image, description=f"{self.instrument}_{str(start_year+n)}", folder=folder,
                                                     fileNamePrefix=f"{self.instrument}_{str(start_year+n)}", 
                                                     crs='EPSG:3857', region=region, maxPixels = 1e13)
-                
-            task.start()
 
             tasks[f"{self.instrument}_{str(start_year+n)}"] = task
 
-        # Wait for tasks to complete
-        keys = list(tasks.keys())
-        status_list = [tasks[key].status().get('state') for key in keys]
-
-        while not status_list == ['COMPLETED'] * len(keys):
-            status_list = [tasks[key].status().get('state') for key in keys]
+        # Start the tasks and wait for them to complete, cancelling all of them if one fails
+        def print_status(progress):
             # Print temporal status
-            tmp_status = dict(zip(keys, status_list))
-            print('Temporal status: ', tmp_status)
+            print('Temporal status: ', progress.states)
 
-            if any(status in ["FAILED", "CANCELLED"] for status in status_list):
-                # print error message for each image
-                for key in keys:
-                    if tasks[key].status().get('state') in ["FAILED", "CANCELLED"]:
-                        print(f"Error with image {key}: {tasks[key].status().get('error_message')}")
+        monitor = ExportTaskMonitor(tasks, backend=backend, max_running=max_running)
+        progress = monitor.run(progress_callback=progress_callback or print_status)
 
-                # Cancel all tasks if one fails
-                map(lambda key: tasks[key].cancel(), keys)
-                
-                break
+        # print error message for each image
+        for key, error in progress.errors.items():
+            print(f"Error with image {key}: {error}")
 
-            time.sleep(60)
+        return progress
 
+    def _thumb_url(self, image, region, dimensions=None):
+        image = ee.Image(image)
 
-        
-    def video_as_array(self, geometry, start_year, stop_year, dimensions=None, alpha_channel=False):
+        if dimensions:
+            image = image.reproject(crs='EPSG:4326', scale=self.scale)
+            visSave = {'dimensions': dimensions, 'format': 'png', 'crs': 'EPSG:3857', 'region': region}
+        else:
+            visSave = {'scale': self.scale, 'region': region, 'crs': 'EPSG:3857'}
+
+        return image.getThumbURL(visSave)
+
+    def _fetch_frame(self, session, image, region, dimensions=None, alpha_channel=False):
+        """
+        Fetch and decode one thumbnail as a (H, W, C) uint8 array, C being 4 with alpha channel and 3 otherwise.
+        """
+        response = session.get(self._thumb_url(image, region, dimensions), timeout=FETCH_TIMEOUT)
+        response.raise_for_status()
+        array = np.asarray(Image.open(io.BytesIO(response.content)), dtype=np.uint8)
+
+        #Add alpha channel if needed
+        if alpha_channel and array.shape[2] == 3:
+            array = np.concatenate([array, np.full(array.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+
+        return array[:, :, :4] if alpha_channel else array[:, :, :3]
+
+    def video_as_array(self, geometry, start_year, stop_year, dimensions=None, alpha_channel=False,
+                       max_workers=FETCH_WORKERS, memmap_path=None, progress_callback=None):
         """
         Create Numpy array with 1 composite per year.
         ----------
@@ -155,43 +202,165 @@ class Animation:
             If only one number is passed, it is used as the maximum, and the other dimension is computed by proportional scaling.
         alpha_channel : Boolean
             If True adds transparency
+        max_workers : int
+            Number of thumbnails fetched and decoded concurrently
+        memmap_path : str
+            If given, frames are written to a memory-mapped .npy file at this path instead of memory
+        progress_callback : callable
+            Called with (frames done, total frames) as every frame arrives
         """ 
 
         # Area of Interest
         region = geometry.get('features')[0].get('geometry').get('coordinates')
-        polygon = ee.Geometry.Polygon(region)
-        bounds = list(shape(geometry.get('features')[0].get('geometry')).bounds)
-        
+
         images = self.create_collection(start_year, stop_year)
-        
-        for n, image in enumerate(images):
-            print(f'Image number: {str(n)}')
-            image = ee.Image(image)
 
-            if dimensions:
-                image =  image.reproject(crs='EPSG:4326', scale=self.scale)
-                visSave = {'dimensions': dimensions, 'format': 'png', 'crs': 'EPSG:3857', 'region':region} 
-            else:
-                visSave = {'scale': self.scale,'region':region, 'crs': 'EPSG:3857'} 
-    
-            url = image.getThumbURL(visSave)
-            response = requests.get(url)
-            array = np.array(Image.open(io.BytesIO(response.content))) 
-            
-            array = array.reshape((1,) + array.shape)
-            
-            #Add alpha channel if needed
-            if alpha_channel and array.shape[3] == 3:
-                array = np.append(array, np.full((array.shape[0],array.shape[1], array.shape[2],1), 255), axis=3)
-                if n == 0:
-                    arrays = array[:,:,:,:4]
-                else:
-                    arrays = np.append(arrays, array[:,:,:,:4], axis=0)
-            else:
-                if n == 0:
-                    arrays = array[:,:,:,:3]
-                else:
-                    arrays = np.append(arrays, array[:,:,:,:3], axis=0)
-        
+        arrays = None
+        with http_session(pool_size=max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._fetch_frame, session, image, region, dimensions, alpha_channel): n
+                       for n, image in enumerate(images)}
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                n = futures[future]
+                array = future.result()
+                log.debug(f"🖼️  frame {n} ({done}/{len(images)})")
+                if progress_callback:
+                    progress_callback(done, len(images))
+
+                # All frames share the shape of the first one to arrive
+                if arrays is None:
+                    shape = (len(images),) + array.shape
+                    if memmap_path:
+                        arrays = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=np.uint8, shape=shape)
+                    else:
+                        arrays = np.empty(shape, dtype=np.uint8)
+
+                arrays[n] = array
+
         return arrays
-        
+
+    def iter_frames(self, geometry, start_year, stop_year, dimensions=None, alpha_channel=False,
+                    max_workers=FETCH_WORKERS, prefetch=4):
+        """
+        Yield the (H, W, C) uint8 frame of every year in order, as soon as it is decoded.
+        ----------
+        start_year : int
+            First year
+        stop_year : int
+            Last year
+        dimensions : int
+            A number or pair of numbers in format WIDTHxHEIGHT Maximum dimensions of the thumbnail to render, in pixels.
+        alpha_channel : Boolean
+            If True adds transparency
+        max_workers : int
+            Number of thumbnails fetched and decoded concurrently
+        prefetch : int
+            Maximum number of frames fetched ahead of the consumer, which bounds memory use
+        """
+        region = geometry.get('features')[0].get('geometry').get('coordinates')
+
+        images = iter(self.create_collection(start_year, stop_year))
+        pending = deque()
+        with http_session(pool_size=max_workers) as session, \
+                ThreadPoolExecutor(max_workers=min(max_workers, prefetch)) as executor:
+            def submit():
+                image = next(images, None)
+                if image is not None:
+                    pending.append(executor.submit(self._fetch_frame, session, image, region, dimensions,
+                                                   alpha_channel))
+
+            for _ in range(prefetch):
+                submit()
+
+            try:
+                while pending:
+                    frame = pending.popleft().result()
+                    submit()
+                    yield frame
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+def _ffmpeg():
+    path = shutil.which('ffmpeg')
+    if path is None:
+        try:
+            import imageio_ffmpeg
+        except ImportError:
+            raise RuntimeError("Writing videos requires ffmpeg on the PATH or the imageio-ffmpeg package.")
+        path = imageio_ffmpeg.get_ffmpeg_exe()
+
+    return path
+
+
+def _write_with_ffmpeg(frames, path, fps, output_args):
+    frames = iter(frames)
+    first = next(frames)
+    height, width, channels = first.shape
+
+    command = [_ffmpeg(), '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgba' if channels == 4 else 'rgb24',
+               '-s', f'{width}x{height}', '-r', str(fps), '-i', '-'] + output_args + [path]
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        for frame in itertools.chain([first], frames):
+            process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+    finally:
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed writing {path}")
+
+
+def write_mp4(frames, path, fps=2):
+    """
+    Encode frames to an H.264 MP4, consuming them one at a time.
+    ----------
+    frames : iterable
+        (H, W, C) uint8 frames, e.g. from `Animation.iter_frames`
+    path : str
+        Output file
+    fps : int
+        Frames per second
+    """
+    _write_with_ffmpeg(frames, path, fps, ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264',
+                                           '-pix_fmt', 'yuv420p'])
+
+
+def write_gif(frames, path, fps=2):
+    """
+    Encode frames to an animated GIF, consuming them one at a time.
+    ----------
+    frames : iterable
+        (H, W, C) uint8 frames, e.g. from `Animation.iter_frames`
+    path : str
+        Output file
+    fps : int
+        Frames per second
+    """
+    _write_with_ffmpeg(frames, path, fps, ['-f', 'gif', '-loop', '0'])
+
+
+def write_png_sequence(frames, folder, prefix='frame'):
+    """
+    Write every frame to its own PNG file, consuming them one at a time.
+    ----------
+    frames : iterable
+        (H, W, C) uint8 frames, e.g. from `Animation.iter_frames`
+    folder : str
+        Output folder
+    prefix : str
+        File name prefix, followed by the zero-padded frame number
+
+    Returns the list of written paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    paths = []
+    for n, frame in enumerate(frames):
+        path = os.path.join(folder, f'{prefix}_{n:04d}.png')
+        Image.fromarray(frame).save(path)
+        paths.append(path)
+
+    return paths
@@ -0,0 +1,60 @@
+from functools import lru_cache
+
+import numpy as np
+
+from soils_revealed.data_params import bbox_indexer
+
+# Authalic (equal-area) Earth radius
+EARTH_RADIUS_KM = 6371.0072
+KM2_TO_HA = 100.
+
+
+def band_area_km2(lat_top, lat_bottom, width):
+    """
+    Area of the band between two latitudes spanning `width` degrees of longitude, in km².
+    """
+    return EARTH_RADIUS_KM ** 2 * np.deg2rad(abs(width)) * np.abs(np.sin(np.deg2rad(lat_top)) -
+                                                                  np.sin(np.deg2rad(lat_bottom)))
+
+
+@lru_cache(maxsize=16)
+def _row_cell_areas(y0, dy, ny, dx):
+    centers = y0 + dy * np.arange(ny)
+    areas = band_area_km2(centers - dy / 2, centers + dy / 2, dx)
+    areas.setflags(write=False)
+
+    return areas
+
+
+def row_cell_areas(ds):
+    """
+    Area in km² of one pixel of every row of the regular lat/lon grid of `ds`.
+
+    Computed once per grid and cached, the vector is meant to be broadcast over (y, x) blocks.
+    """
+    y, x = ds['y'].values, ds['x'].values
+    dy = (y[-1] - y[0]) / (y.size - 1) if y.size > 1 else 0.
+    dx = (x[-1] - x[0]) / (x.size - 1) if x.size > 1 else 0.
+
+    return _row_cell_areas(float(y[0]), float(dy), int(y.size), float(dx))
+
+
+def bbox_area_km2(xmin, ymin, xmax, ymax):
+    """
+    Area in km² of a lon/lat rectangle on the authalic sphere, independent of any pixel grid.
+    """
+    return float(band_area_km2(ymax, ymin, xmax - xmin))
+
+
+def selection_area_km2(ds, bbox):
+    """
+    Area in km² of the pixels of `ds` selected by a bbox, the sum of the `row_cell_areas` that
+    weight them.
+
+    Parameters:
+    ds (xr.Dataset): Dataset with a regular lat/lon grid.
+    bbox (tuple): (xmin, ymin, xmax, ymax).
+    """
+    y, x = bbox_indexer(ds, bbox)
+
+    return float(row_cell_areas(ds)[y].sum() * max(x.stop - x.start, 0))
@@ -0,0 +1,169 @@
+import abc
+
+import ee
+from shapely.geometry import mapping
+
+from soils_revealed.area import KM2_TO_HA, bbox_area_km2, row_cell_areas
+from soils_revealed.data_params import GEEData, bbox_indexer
+from soils_revealed.masks import as_shape, get_mask, is_rectangle
+from soils_revealed.processing import get_data
+from soils_revealed.transitions import N_GROUPS, empty_matrix, matrix_to_data, metadata
+
+SOC_STOCK_COLLECTION = 'projects/soils-revealed/Recent/SOC_stock_nov2020'
+
+# Boxes larger than this (in km², about 20 square degrees at the equator) are aggregated by Earth Engine
+REMOTE_MIN_AREA_KM2 = 250_000.0
+
+
+class ComputeBackend(abc.ABC):
+    """
+    Computes the {lc_2018: {lc_2000: sum}} transition dict of a bbox.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def get_data(self, bbox) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def get_data_geometry(self, geometry) -> dict:
+        """
+        Same as `get_data` for a GeoJSON (multi)polygon.
+        """
+
+
+class LocalZarrBackend(ComputeBackend):
+    """
+    Reduces the zarr pixels of the bbox, chunk by chunk for large boxes.
+
+    Parameters:
+    ds (xr.Dataset): Dataset as returned by `read_ds`.
+    area_weighted (bool): Weight every pixel by its area, summing t C instead of t C/ha.
+    """
+    name = 'local-zarr'
+
+    def __init__(self, ds, area_weighted=False):
+        self.ds = ds
+        self.area_weighted = area_weighted
+
+    def _get_data(self, y, x, mask=None):
+        row_weights = row_cell_areas(self.ds)[y] * KM2_TO_HA if self.area_weighted else None
+
+        return get_data(self.ds.isel(y=y, x=x), row_weights=row_weights, mask=mask)
+
+    def get_data(self, bbox):
+        return self._get_data(*bbox_indexer(self.ds, bbox))
+
+    def get_data_geometry(self, geometry):
+        # Rasterized once per geometry, chunks outside the polygon are not read
+        return self._get_data(*get_mask(self.ds, geometry))
+
+
+class SummedAreaBackend(ComputeBackend):
+    """
+    Answers bbox queries from a prebuilt `integral.SummedAreaIndex`.
+    """
+    name = 'summed-area-index'
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_data(self, bbox):
+        return self.index.get_data(bbox)
+
+    def get_data_geometry(self, geometry):
+        # Tiles are summed over whole boxes, only rectangles can be answered
+        if not is_rectangle(geometry):
+            raise ValueError("A summed-area index only answers rectangles, use a local or remote backend")
+        return self.get_data(as_shape(geometry).bounds)
+
+
+class EEGroupedReducerBackend(ComputeBackend):
+    """
+    Lets Earth Engine sum the stock change grouped by land cover transition.
+
+    Parameters:
+    client: The `ee` module, or a stub with the same interface.
+    max_pixels (float): `maxPixels` of the reduction.
+    area_weighted (bool): Weight every pixel by its area, summing t C instead of t C/ha.
+    """
+    name = 'ee-grouped-reducer'
+
+    def __init__(self, client=ee, max_pixels=1e13, area_weighted=False):
+        self.ee = client
+        self.max_pixels = max_pixels
+        self.area_weighted = area_weighted
+
+    def _year_image(self, collection_id, year):
+        return self.ee.Image(self.ee.ImageCollection(collection_id).filterDate(f'{year}-01-01', f'{year}-12-31')
+                             .first())
+
+    def image(self):
+        """
+        Two band image: stock change and transition index (lc_2000 group * N_GROUPS + lc_2018 group).
+
+        Masked land cover pixels and codes without a group fall in the 'No Data' group, as the
+        0 code that stands for them in the zarr stores.
+        """
+        land_cover_collection = GEEData('Global-Land-Cover').image_collection_id()
+        codes = [int(code) for code in metadata.class_group_names]
+        groups = [int(metadata.code_to_group[code]) for code in codes]
+        no_data = int(metadata.code_to_group[0])
+
+        change = self._year_image(SOC_STOCK_COLLECTION, 2018).subtract(
+            self._year_image(SOC_STOCK_COLLECTION, 2000)).rename('change')
+        lc_2000 = self._year_image(land_cover_collection, 2000).unmask(0)
+        lc_2018 = self._year_image(land_cover_collection, 2018).unmask(0)
+        transition = lc_2000.remap(codes, groups, no_data).multiply(N_GROUPS).add(
+            lc_2018.remap(codes, groups, no_data))
+
+        mask = lc_2000.neq(lc_2018).And(change.neq(0))
+        if self.area_weighted:
+            # pixelArea is in m², stocks are per ha
+            change = change.multiply(self.ee.Image.pixelArea().divide(1e4))
+
+        return change.addBands(transition.rename('transition')).updateMask(mask)
+
+    def reduce(self, bbox, geometry=None):
+        """
+        Transition matrix of a bbox, or of a GeoJSON (multi)polygon if given, as returned by
+        `transitions.transition_matrix`.
+        """
+        reducer = self.ee.Reducer.sum().combine(self.ee.Reducer.count(), sharedInputs=True).unweighted() \
+            .group(groupField=1, groupName='transition')
+
+        # Without crs or scale the reduction runs in the projection of the stocks
+        region = self.ee.Geometry(mapping(as_shape(geometry))) if geometry is not None \
+            else self.ee.Geometry.Rectangle(list(bbox))
+        result = self.image().reduceRegion(reducer=reducer, geometry=region, maxPixels=self.max_pixels).getInfo()
+
+        sums, counts = empty_matrix()
+        for group in result.get('groups', []):
+            index = int(group['transition'])
+            sums.ravel()[index] += group['sum']
+            counts.ravel()[index] += group['count']
+
+        return sums, counts
+
+    def get_data(self, bbox):
+        return matrix_to_data(*self.reduce(bbox))
+
+    def get_data_geometry(self, geometry):
+        return matrix_to_data(*self.reduce(as_shape(geometry).bounds, geometry=geometry))
+
+
+def select_backend(bbox, local, remote=None, index=None, remote_min_area_km2=REMOTE_MIN_AREA_KM2, polygon=False):
+    """
+    Pick the cheapest backend for a bbox.
+
+    A summed-area index answers any bbox in constant time, otherwise boxes larger than
+    `remote_min_area_km2` go to Earth Engine and smaller ones are read locally.
+    With `polygon` the bbox is the bounds of a polygon, which the index cannot answer.
+    """
+    if index is not None and not polygon:
+        return index
+
+    if remote is not None and bbox_area_km2(*bbox) > remote_min_area_km2:
+        return remote
+
+    return local
@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import dask
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import shape
+
+from soils_revealed.chunk_cache import ChunkCacheConfig
+from soils_revealed.data_params import bbox_indexer, read_ds
+from soils_revealed.scheduling import PlanMetrics, chunk_bounds, execute, plan
+from soils_revealed.transitions import matrix_to_data
+
+log = logging.getLogger(__name__)
+
+SCHEMA = pa.schema([('id', pa.string()), ('lc_2018', pa.string()), ('lc_2000', pa.string()),
+                    ('soc_change', pa.float64())])
+
+# Chunks shared with the features of other groups are read again from memory
+WORKER_CACHE = ChunkCacheConfig(memory_bytes=1024 * 2 ** 20)
+
+
+def check_unique_ids(features):
+    """
+    Raise ValueError if several features share an id, their results and done marks would overwrite each other.
+    """
+    seen, duplicates = set(), set()
+    for feature_id, _ in features:
+        (duplicates if feature_id in seen else seen).add(feature_id)
+
+    if duplicates:
+        raise ValueError(f"Duplicate feature ids: {', '.join(sorted(duplicates)[:10])}"
+                         f"{' ...' if len(duplicates) > 10 else ''}")
+
+    return features
+
+
+def read_features(path, id_field='id'):
+    """
+    Read the (id, shapely geometry) pairs of a GeoJSON or GeoParquet file.
+
+    Features without `id_field` are identified by their position in the file. Raises ValueError
+    if ids are not unique.
+    """
+    if path.endswith(('.parquet', '.geoparquet')):
+        table = pq.read_table(path)
+        metadata = json.loads((table.schema.metadata or {}).get(b'geo', b'{}'))
+        geometries = shapely.from_wkb(table.column(metadata.get('primary_column', 'geometry')).to_numpy(False))
+        ids = table.column(id_field).to_pylist() if id_field in table.column_names else range(len(geometries))
+        return check_unique_ids([(str(feature_id), geometry) for feature_id, geometry in zip(ids, geometries)])
+
+    with open(path) as f:
+        collection = json.load(f)
+
+    return check_unique_ids([(str((feature.get('properties') or {}).get(id_field, feature.get('id', n))),
+                              shape(feature['geometry']))
+                             for n, feature in enumerate(collection['features'])])
+
+
+def group_by_chunk(ds, features, chunks_per_group=4):
+    """
+    Group features by the block of `chunks_per_group` x `chunks_per_group` plan chunks holding
+    the top-left pixel of their bounds.
+
+    The chunks are those `scheduling.plan` maps regions onto, so neighbouring features mostly fall
+    in the same group, whose chunks are then read once (see `scheduling.execute`).
+
+    Returns:
+    dict: (y chunk, x chunk) -> list of (id, geometry) pairs.
+    """
+    row_bounds = chunk_bounds(ds, 'y')[1:]
+    column_bounds = chunk_bounds(ds, 'x')[1:]
+
+    groups = {}
+    for feature_id, geometry in features:
+        y, x = bbox_indexer(ds, geometry.bounds)
+        key = int(np.searchsorted(row_bounds, y.start, side='right')) // chunks_per_group, \
+            int(np.searchsorted(column_bounds, x.start, side='right')) // chunks_per_group
+        groups.setdefault(key, []).append((feature_id, geometry))
+
+    return groups
+
+
+def part_name(key, group):
+    """
+    File name of the results of a group, unique to its chunk block and feature ids.
+    """
+    digest = hashlib.sha1('\n'.join(feature_id for feature_id, _ in group).encode()).hexdigest()[:12]
+    return f'part-{key[0]:05d}-{key[1]:05d}-{digest}.parquet'
+
+
+_worker_ds = None
+
+
+def _init_worker(open_dataset):
+    global _worker_ds
+    # One process per core already, chunks are reduced in the calling thread
+    dask.config.set(scheduler='synchronous')
+    _worker_ds = open_dataset()
+
+
+def _process_group(features):
+    results, metrics = execute(_worker_ds, plan(_worker_ds, features), max_workers=1)
+
+    rows = []
+    for feature_id, matrix in results.items():
+        rows.extend({'id': feature_id, 'lc_2018': lc_2018, 'lc_2000': lc_2000, 'soc_change': value}
+                    for lc_2018, values in matrix_to_data(*matrix).items() for lc_2000, value in values.items())
+
+    return rows, metrics
+
+
+def _write_part(path, rows, feature_ids):
+    # The ids of the features, even those without any transition, mark them as done.
+    # Written then renamed, so a part file only exists once complete.
+    schema = SCHEMA.with_metadata({'ids': json.dumps(feature_ids)})
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def done_ids(output_dir):
+    """
+    Ids of the features already written to `output_dir`.
+    """
+    ids = set()
+    for entry in os.scandir(output_dir):
+        if entry.name.endswith('.parquet'):
+            ids.update(json.loads(pq.read_schema(entry.path).metadata[b'ids']))
+
+    return ids
+
+
+def run_batch(features, output_dir, open_dataset, max_workers=None, chunks_per_group=4, progress_callback=None):
+    """
+    Compute the SOC stock change by land cover transition of many features.
+
+    Results are written as Parquet part files, one per group of features, into `output_dir`,
+    readable at once with `pandas.read_parquet(output_dir)`. Features already written are
+    skipped, so rerunning an interrupted batch resumes where it stopped.
+
+    Parameters:
+    features (list): (id, shapely geometry) pairs with unique ids, see `read_features`.
+    output_dir (str): Directory of the part files.
+    open_dataset (callable): Picklable function returning the dataset, called once per worker.
+    max_workers (int): Number of worker processes, defaults to the number of cores.
+    chunks_per_group (int): Size of the blocks of chunks features are grouped by, see `group_by_chunk`.
+    progress_callback (callable): Called with (features done, total features) after every group.
+
+    Returns:
+    PlanMetrics: Chunk reads of this run, summed over the groups.
+    """
+    check_unique_ids(features)
+    os.makedirs(output_dir, exist_ok=True)
+
+    done = done_ids(output_dir)
+    remaining = [(feature_id, geometry) for feature_id, geometry in features if feature_id not in done]
+
+    groups = group_by_chunk(open_dataset(), remaining, chunks_per_group=chunks_per_group)
+    pending = {os.path.join(output_dir, part_name(key, group)): group for key, group in sorted(groups.items())}
+
+    total = len(features)
+    done = total - len(remaining)
+    log.info(f"📦  {len(remaining)} of {total} features left, in {len(pending)} groups")
+
+    metrics = PlanMetrics()
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(open_dataset,)) as executor:
+        futures = {executor.submit(_process_group, group): path for path, group in pending.items()}
+        for future in as_completed(futures):
+            path = futures[future]
+            rows, group_metrics = future.result()
+            _write_part(path, rows, [feature_id for feature_id, _ in pending[path]])
+
+            metrics.regions += group_metrics.regions
+            metrics.chunks_read += group_metrics.chunks_read
+            metrics.naive_chunk_reads += group_metrics.naive_chunk_reads
+            metrics.seconds += group_metrics.seconds
+
+            done += len(pending[path])
+            log.info(f"📦  {done}/{total} features done, {metrics.chunks_read} chunks read instead of "
+                     f"{metrics.naive_chunk_reads}")
+            if progress_callback:
+                progress_callback(done, total)
+
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute SOC stock change statistics of many geometries.")
+    parser.add_argument('input', help="GeoJSON or GeoParquet file of the features.")
+    parser.add_argument('output', help="Directory of the Parquet part files. Rerun with the same one to resume.")
+    parser.add_argument('--id-field', default='id', help="Property identifying the features.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes.")
+    parser.add_argument('--chunks-per-group', type=int, default=4, help="Features are grouped by blocks of "
+                                                                        "this many chunks along y and x.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    open_dataset = partial(read_ds, access_key_id=os.environ['S3_ACCESS_KEY_ID'],
+                           secret_accsess_key=os.environ['S3_SECRET_ACCESS_KEY'], cache=WORKER_CACHE)
+    run_batch(read_features(args.input, id_field=args.id_field), args.output, open_dataset,
+              max_workers=args.workers, chunks_per_group=args.chunks_per_group)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fsspec import FSMap
+from zarr.storage import BaseStore
+
+
+@dataclass
+class ChunkCacheConfig:
+    """
+    Settings of the chunk cache placed under `read_zarr_from_s3`.
+
+    All the stores wrapped by one config share its memory and disk tiers, so the byte budgets
+    bound the whole cache, whatever the number of datasets.
+
+    memory_bytes (int): Byte budget of the in-memory LRU.
+    disk_path (str): Directory of the on-disk cache. No disk tier if None.
+    disk_bytes (int): Byte budget of the on-disk cache.
+    """
+    memory_bytes: int = 256 * 2 ** 20
+    disk_path: str = None
+    disk_bytes: int = 4 * 2 ** 30
+
+    def __post_init__(self):
+        self._tiers = None
+        self._caches = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Settings only: every process builds its own tiers
+        return {'memory_bytes': self.memory_bytes, 'disk_path': self.disk_path, 'disk_bytes': self.disk_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__post_init__()
+
+    def wrap(self, store, namespace=''):
+        with self._lock:
+            if self._tiers is None:
+                disk = DiskLRU(self.disk_path, self.disk_bytes) if self.disk_path else None
+                self._tiers = MemoryLRU(self.memory_bytes), disk, threading.Lock()
+
+            memory, disk, lock = self._tiers
+            cache = LayeredChunkCache(store, memory=memory, disk=disk, namespace=namespace, lock=lock)
+            self._caches.append(cache)
+
+        return cache
+
+    @property
+    def caches(self):
+        """
+        The `LayeredChunkCache`s of the stores wrapped so far.
+        """
+        with self._lock:
+            return list(self._caches)
+
+    def stats(self):
+        """
+        Hits and misses of every namespace and of the whole cache, with the usage of the shared tiers.
+        """
+        namespaces = {}
+        for cache in self.caches:
+            counts = namespaces.setdefault(cache.namespace, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+            counts['memory_hits'] += cache.memory_hits
+            counts['disk_hits'] += cache.disk_hits
+            counts['misses'] += cache.misses
+
+        totals = {key: sum(counts[key] for counts in namespaces.values())
+                  for key in ('memory_hits', 'disk_hits', 'misses')}
+        memory, disk = self._tiers[:2] if self._tiers else (None, None)
+
+        return {**totals, 'hit_rate': _hit_rate(**totals), 'namespaces': namespaces,
+                'memory_bytes': memory.size if memory else 0,
+                'memory_evictions': memory.evictions if memory else 0,
+                'disk_bytes': disk.size if disk else 0, 'disk_evictions': disk.evictions if disk else 0}
+
+
+def _hit_rate(memory_hits, disk_hits, misses):
+    requests = memory_hits + disk_hits + misses
+    return (memory_hits + disk_hits) / requests if requests else 0.
+
+
+class MemoryLRU:
+    """
+    Byte-bounded in-memory LRU of cached values.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._values = OrderedDict()
+
+    def get(self, key):
+        value = self._values.get(key)
+        if value is not None:
+            self._values.move_to_end(key)
+
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        self.discard(key)
+        self._values[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, old_value = self._values.popitem(last=False)
+            self.size -= len(old_value)
+            self.evictions += 1
+
+    def discard(self, key):
+        value = self._values.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+
+    def __contains__(self, key):
+        return key in self._values
+
+
+class DiskLRU:
+    """
+    Size-bounded directory of cached values, evicting the least recently used files first.
+
+    Thread-safe: files are read and written outside the lock, which only guards the index.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+        # Recover the access order of a previous run from the file modification times
+        entries = sorted(os.scandir(path), key=lambda entry: entry.stat().st_mtime)
+        self._files = OrderedDict((entry.name, entry.stat().st_size) for entry in entries
+                                  if entry.is_file() and not entry.name.startswith('.tmp-'))
+        self.size = sum(self._files.values())
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._name(key) in self._files
+
+    def get(self, key):
+        name = self._name(key)
+        with self._lock:
+            if name not in self._files:
+                return None
+
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                if name in self._files:
+                    self.size -= self._files.pop(name)
+            return None
+
+        with self._lock:
+            if name in self._files:
+                self._files.move_to_end(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        name = self._name(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+
+        with self._lock:
+            os.replace(tmp_path, os.path.join(self.path, name))
+            if name in self._files:
+                self.size -= self._files.pop(name)
+            self._files[name] = len(value)
+            self.size += len(value)
+
+            evicted = []
+            while self.size > self.max_bytes:
+                old_name, old_size = self._files.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+                evicted.append(old_name)
+
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.path, old_name))
+            except FileNotFoundError:
+                pass
+
+    def discard(self, key):
+        name = self._name(key)
+        with self._lock:
+            if name not in self._files:
+                return
+            self.size -= self._files.pop(name)
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+
+class LayeredChunkCache(BaseStore):
+    """
+    Read-through zarr store cache: a `MemoryLRU` in front of an optional `DiskLRU`
+    in front of the wrapped store (e.g. an `s3fs.S3Map` or a local `zarr.DirectoryStore`).
+
+    A zarr store itself, so that zarr hands it whole batches of chunk keys (`getitems`): cached
+    chunks are served without touching the wrapped store and the misses are fetched together.
+
+    Parameters:
+    store (MutableMapping): The store being cached.
+    memory (MemoryLRU): In-memory tier, possibly shared with other stores.
+    disk (DiskLRU): Optional on-disk tier, possibly shared with other stores.
+    namespace (str): Prefix of the keys of this store in the tiers.
+    lock (threading.Lock): Lock guarding the memory tier, the same for all the stores sharing it.
+    """
+
+    def __init__(self, store, memory=None, disk=None, namespace='', lock=None):
+        self.store = store
+        self.memory = MemoryLRU(256 * 2 ** 20) if memory is None else memory
+        self.disk = disk
+        self.namespace = namespace
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock() if lock is None else lock
+
+    def _tier_key(self, key):
+        return f'{self.namespace}/{key}'
+
+    def _cached(self, key):
+        # Memory then disk, None on a miss
+        tier_key = self._tier_key(key)
+        with self._lock:
+            value = self.memory.get(tier_key)
+            if value is not None:
+                self.memory_hits += 1
+                return value
+
+        value = self.disk.get(tier_key) if self.disk else None
+        if value is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self.memory.put(tier_key, value)
+
+        return value
+
+    def _remember(self, key, value):
+        tier_key = self._tier_key(key)
+        with self._lock:
+            self.misses += 1
+            self.memory.put(tier_key, value)
+        if self.disk:
+            self.disk.put(tier_key, value)
+
+    def _fetch(self, keys):
+        if not keys:
+            return {}
+        # fsspec maps (s3fs.S3Map) download a batch of keys concurrently
+        if isinstance(self.store, FSMap):
+            return self.store.getitems(keys, on_error='omit')
+
+        values = {}
+        for key in keys:
+            try:
+                values[key] = self.store[key]
+            except KeyError:
+                pass
+
+        return values
+
+    def __getitem__(self, key):
+        value = self._cached(key)
+        if value is not None:
+            return value
+
+        # Fetch outside the lock so chunks can be downloaded concurrently
+        value = bytes(self.store[key])
+        self._remember(key, value)
+
+        return value
+
+    def getitems(self, keys, *, contexts=None, on_error='omit'):
+        """
+        Values of the keys present in the cache or the store, fetching all the misses in one batch.
+        """
+        values, missing = {}, []
+        for key in keys:
+            value = self._cached(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+
+        for key, value in self._fetch(missing).items():
+            values[key] = bytes(value)
+            self._remember(key, values[key])
+
+        return values
+
+    def __contains__(self, key):
+        tier_key = self._tier_key(key)
+        with self._lock:
+            if tier_key in self.memory:
+                return True
+        if self.disk and tier_key in self.disk:
+            return True
+
+        return key in self.store
+
+    def __setitem__(self, key, value):
+        self.invalidate(key)
+        self.store[key] = value
+
+    def __delitem__(self, key):
+        self.invalidate(key)
+        del self.store[key]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def invalidate(self, key):
+        tier_key = self._tier_key(key)
+        with self._lock:
+            self.memory.discard(tier_key)
+        if self.disk:
+            self.disk.discard(tier_key)
+
+    def stats(self):
+        """
+        Hits and misses of this store, with the usage of the (possibly shared) tiers.
+        """
+        return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': _hit_rate(self.memory_hits, self.disk_hits, self.misses),
+                'memory_bytes': self.memory.size, 'memory_evictions': self.memory.evictions,
+                'disk_bytes': self.disk.size if self.disk else 0,
+                'disk_evictions': self.disk.evictions if self.disk else 0}
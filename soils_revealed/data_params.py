@@ -1,5 +1,9 @@
 import datetime
+import threading
+import time
 from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
 
 import ee
 import s3fs
@@ -8,16 +12,24 @@ import rioxarray
 import numpy as np
 
 NOW = datetime.datetime.now()
+S3_MAX_POOL_CONNECTIONS = 64
+# Pre-joined store built with `python -m soils_revealed.analysis_ready`
+ANALYSIS_READY_DATASET = 'soc-change-analysis-ready'
 
 
-def read_zarr_from_s3(access_key_id, secret_accsess_key, dataset, group=None):
+def read_zarr_from_s3(access_key_id, secret_accsess_key, dataset, group=None, s3=None, cache=None):
     # AWS S3 path
     s3_path = f's3://soils-revealed/{dataset}.zarr'
 
     # Initilize the S3 file system
-    s3 = s3fs.S3FileSystem(key=access_key_id, secret=secret_accsess_key)
+    if s3 is None:
+        s3 = s3fs.S3FileSystem(key=access_key_id, secret=secret_accsess_key)
     store = s3fs.S3Map(root=s3_path, s3=s3, check=False)
 
+    # Optional local chunk cache (see chunk_cache.ChunkCacheConfig)
+    if cache is not None:
+        store = cache.wrap(store, namespace=dataset)
+
     # Read Zarr file
     if group:
         ds = xr.open_zarr(store=store, group=group, consolidated=True)
@@ -27,112 +39,234 @@ def read_zarr_from_s3(access_key_id, secret_accsess_key, dataset, group=None):
     return ds
 
 
-def read_ds(access_key_id, secret_accsess_key):
+class DatasetProvider:
+    """
+    Process-wide cache of opened datasets.
+
+    Shares one pooled S3 file system between all stores and keeps every opened
+    `xr.Dataset`, so only the first caller pays for reading the consolidated metadata.
+    """
+
+    def __init__(self, access_key_id, secret_accsess_key, cache=None):
+        self.access_key_id = access_key_id
+        self.secret_accsess_key = secret_accsess_key
+        self.cache = cache
+        self.s3 = s3fs.S3FileSystem(key=access_key_id, secret=secret_accsess_key,
+                                    config_kwargs={'max_pool_connections': S3_MAX_POOL_CONNECTIONS})
+        self.hits = 0
+        self.misses = 0
+        self.open_seconds = 0.
+        self._datasets = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, opener):
+        """
+        Return the dataset cached under `key`, calling `opener()` on the first request.
+
+        `opener` runs under a lock of its own key only, so it can open other datasets through
+        this provider and concurrent first requests of a key still open it once.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._datasets:
+                    self.hits += 1
+                    return self._datasets[key]
+
+            start = time.perf_counter()
+            ds = opener()
+            with self._lock:
+                self.open_seconds += time.perf_counter() - start
+                self.misses += 1
+                self._datasets[key] = ds
+
+            return ds
+
+    def open_zarr(self, dataset, group=None):
+        return self.get(('zarr', dataset, group),
+                        lambda: read_zarr_from_s3(access_key_id=self.access_key_id,
+                                                  secret_accsess_key=self.secret_accsess_key,
+                                                  dataset=dataset, group=group, s3=self.s3,
+                                                  cache=self.cache))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'open_seconds': self.open_seconds,
+                'datasets': len(self._datasets), 'chunk_cache': self.cache.stats() if self.cache else None}
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(access_key_id, secret_accsess_key, cache=None):
+    """
+    Return the process-wide `DatasetProvider` for a set of credentials.
+
+    `cache` only applies when the provider is first created.
+    """
+    with _providers_lock:
+        key = (access_key_id, secret_accsess_key)
+        if key not in _providers:
+            _providers[key] = DatasetProvider(access_key_id=access_key_id, secret_accsess_key=secret_accsess_key,
+                                              cache=cache)
+
+        return _providers[key]
+
+
+def read_joined_ds(provider):
+    """
+    Join the 2000 and 2018 stocks of the Recent dataset with the land cover store.
+    """
     # Read Recent dataset
-    dataset = 'global-dataset'
-    group = 'recent'
-    ds = read_zarr_from_s3(access_key_id=access_key_id,
-                           secret_accsess_key=secret_accsess_key,
-                           dataset=dataset, group=group)
+    ds = provider.open_zarr(dataset='global-dataset', group='recent')
     ds = ds.drop_dims('depth').sel(time=['2000-12-31T00:00:00.000000000', '2018-12-31T00:00:00.000000000'])
 
     # Read land cover dataset
-    dataset = 'land-cover'
-    ds_lc = read_zarr_from_s3(access_key_id=access_key_id,
-                              secret_accsess_key=secret_accsess_key,
-                              dataset=dataset)
+    ds_lc = provider.open_zarr(dataset='land-cover')
 
     ds['land-cover'] = ds_lc['land-cover']
 
     return ds
 
 
-@dataclass
-class GEEData:
-    dataset: str
+def _read_ds(provider):
+    # Fast path: one co-chunked store holding only the variables and years used
+    if provider.s3.exists(f'soils-revealed/{ANALYSIS_READY_DATASET}.zarr/.zmetadata'):
+        return provider.open_zarr(dataset=ANALYSIS_READY_DATASET)
 
-    def image_collection_id(self):
-        return {'Global-Land-Cover': 'projects/soils-revealed/ESA_landcover_ipcc',
-                'SOC-Stock-Change': 'projects/soils-revealed/Recent/SOC_stocks'}[self.dataset]
+    return read_joined_ds(provider)
 
-    def ee_image(self, year='2018'):
-        return {'Global-Land-Cover': ee.Image(ee.ImageCollection(self.image_collection_id()).
-                                              filterDate(f'{year}-01-01', f'{year}-12-31').first()),
-                'SOC-Stock-Change': ee.ImageCollection('projects/soils-revealed/Recent/SOC_stock_nov2020').filterDate(
-                    '2018-01-01', '2018-12-31').first().subtract(
-                    ee.ImageCollection('projects/soils-revealed/Recent/SOC_stock_nov2020').filterDate(
-                        '2000-01-01', '2000-12-31').first())
-                }[self.dataset]
 
-    def sld_interval(self):
-        return {'Global-Land-Cover': '<RasterSymbolizer>' + '<ColorMap type="values" extended="false">' +
-                                     '<ColorMapEntry color="#ffff64" quantity="10" />' +
-                                     '<ColorMapEntry color="#ffff64" quantity="11" />' +
-                                     '<ColorMapEntry color="#ffff00" quantity="12" />' +
-                                     '<ColorMapEntry color="#aaf0f0" quantity="20" />' +
-                                     '<ColorMapEntry color="#dcf064" quantity="30" />' +
-                                     '<ColorMapEntry color="#c8c864" quantity="40" />' +
-                                     '<ColorMapEntry color="#006400" quantity="50" />' +
-                                     '<ColorMapEntry color="#00a000" quantity="60" />' +
-                                     '<ColorMapEntry color="#00a000" quantity="61" />' +
-                                     '<ColorMapEntry color="#aac800" quantity="62" />' +
-                                     '<ColorMapEntry color="#003c00" quantity="70" />' +
-                                     '<ColorMapEntry color="#003c00" quantity="71" />' +
-                                     '<ColorMapEntry color="#005000" quantity="72" />' +
-                                     '<ColorMapEntry color="#285000" quantity="80" />' +
-                                     '<ColorMapEntry color="#285000" quantity="81" />' +
-                                     '<ColorMapEntry color="#286400" quantity="82" />' +
-                                     '<ColorMapEntry color="#788200" quantity="90" />' +
-                                     '<ColorMapEntry color="#8ca000" quantity="100" />' +
-                                     '<ColorMapEntry color="#be9600" quantity="110" />' +
-                                     '<ColorMapEntry color="#966400" quantity="120" />' +
-                                     '<ColorMapEntry color="#966400" quantity="121" />' +
-                                     '<ColorMapEntry color="#966400" quantity="122" />' +
-                                     '<ColorMapEntry color="#ffb432" quantity="130" />' +
-                                     '<ColorMapEntry color="#ffdcd2" quantity="140" />' +
-                                     '<ColorMapEntry color="#ffebaf" quantity="150" />' +
-                                     '<ColorMapEntry color="#ffc864" quantity="151" />' +
-                                     '<ColorMapEntry color="#ffd278" quantity="152" />' +
-                                     '<ColorMapEntry color="#ffebaf" quantity="153" />' +
-                                     '<ColorMapEntry color="#00785a" quantity="160" />' +
-                                     '<ColorMapEntry color="#009678" quantity="170" />' +
-                                     '<ColorMapEntry color="#00dc82" quantity="180" />' +
-                                     '<ColorMapEntry color="#c31400" quantity="190" />' +
-                                     '<ColorMapEntry color="#fff5d7" quantity="200" />' +
-                                     '<ColorMapEntry color="#dcdcdc" quantity="201" />' +
-                                     '<ColorMapEntry color="#fff5d7" quantity="202" />' +
-                                     '<ColorMapEntry color="#0046c8" quantity="210" opacity="0" />' +
-                                     '<ColorMapEntry color="#ffffff" quantity="220" />' +
-                                     '</ColorMap>' + '</RasterSymbolizer>',
-                'SOC-Stock-Change': '<RasterSymbolizer>' + '<ColorMap extended="false" type="ramp">' +
-                                    '<ColorMapEntry color="#B30200" quantity="-10"  opacity="1" />' +
-                                    '<ColorMapEntry color="#E34A33" quantity="-7.5"  />' +
-                                    '<ColorMapEntry color="#FC8D59" quantity="-5" />' +
-                                    '<ColorMapEntry color="#FDCC8A" quantity="-2.5"  />' +
-                                    '<ColorMapEntry color="#FFFFCC" quantity="0"  />' +
-                                    '<ColorMapEntry color="#A1DAB4" quantity="2.5" />' +
-                                    '<ColorMapEntry color="#31B3BD" quantity="5"  />' +
-                                    '<ColorMapEntry color="#1C9099" quantity="7.5" />' +
-                                    '<ColorMapEntry color="#066C59" quantity="10"  />' +
-                                    '</ColorMap>' + '</RasterSymbolizer>'
-                }[self.dataset]
+def read_ds(access_key_id, secret_accsess_key, cache=None):
+    provider = get_provider(access_key_id=access_key_id, secret_accsess_key=secret_accsess_key, cache=cache)
 
-    def class_colors(self):
-        return {'Global-Land-Cover': {"10": "#ffff64", "11": "#ffff64", "12": "#ffff00", "20": "#aaf0f0",
-                                      "30": "#dcf064", "40": "#c8c864", "50": "#006400", "60": "#00a000",
-                                      "61": "#00a000", "62": "#aac800", "70": "#003c00", "71": "#003c00",
-                                      "72": "#005000", "80": "#285000", "81": "#285000", "82": "#286400",
-                                      "90": "#788200", "100": "#8ca000", "110": "#be9600", "120": "#966400",
-                                      "121": "#966400", "122": "#966400", "130": "#ffb432", "140": "#ffdcd2",
-                                      "150": "#ffebaf", "151": "#ffc864", "152": "#ffd278", "153": "#ffebaf",
-                                      "160": "#00785a", "170": "#009678", "180": "#00dc82", "190": "#c31400",
-                                      "200": "#fff5d7", "201": "#dcdcdc", "202": "#fff5d7", "210": "#0046c8",
-                                      "220": "#ffffff"},
-                'SOC-Stock-Change': {}
-                }[self.dataset]
+    return provider.get(('read_ds',), lambda: _read_ds(provider))
 
-    def class_names(self):
-        return {'Global-Land-Cover': {"10": "Cropland, rainfed",
+
+def _read_timeseries_ds(provider):
+    # Every year of the stocks, land cover of 2000 and 2018 along its own `lc_time` dimension
+    ds = provider.open_zarr(dataset='global-dataset', group='recent').drop_dims('depth')
+
+    ds_lc = provider.open_zarr(dataset='land-cover')
+    ds['land-cover'] = ds_lc['land-cover'].sel(time=['2000-12-31T00:00:00.000000000',
+                                                     '2018-12-31T00:00:00.000000000']).rename(time='lc_time')
+
+    return ds
+
+
+def read_timeseries_ds(access_key_id, secret_accsess_key, cache=None):
+    """
+    Dataset of the time series mode (see `timeseries.trajectories`), keeping the full `time` axis of the stocks.
+    """
+    provider = get_provider(access_key_id=access_key_id, secret_accsess_key=secret_accsess_key, cache=cache)
+
+    return provider.get(('read_timeseries_ds',), lambda: _read_timeseries_ds(provider))
+
+
+def _read_depth_ds(provider):
+    # Depth-resolved variables of the 2000 and 2018 stocks, with the land cover of the same years
+    ds = provider.open_zarr(dataset='global-dataset', group='recent')
+    ds = ds.sel(time=['2000-12-31T00:00:00.000000000', '2018-12-31T00:00:00.000000000'])
+
+    ds_lc = provider.open_zarr(dataset='land-cover')
+    ds['land-cover'] = ds_lc['land-cover']
+
+    return ds
+
+
+def read_depth_ds(access_key_id, secret_accsess_key, cache=None):
+    """
+    Dataset of the depth-resolved mode (see `depth.reduce_depths`), keeping the `depth` dimension.
+    """
+    provider = get_provider(access_key_id=access_key_id, secret_accsess_key=secret_accsess_key, cache=cache)
+
+    return provider.get(('read_depth_ds',), lambda: _read_depth_ds(provider))
+
+
+def bbox_indexer(ds, bbox):
+    """
+    Positional (y, x) slices selected by `ds.sel(x=slice(xmin, xmax), y=slice(ymax, ymin))`.
+
+    Parameters:
+    ds (xr.Dataset): Dataset with `x` and `y` coordinates.
+    bbox (tuple): (xmin, ymin, xmax, ymax).
+    """
+    xmin, ymin, xmax, ymax = bbox
+    y = ds.indexes['y'].slice_indexer(ymax, ymin)
+    x = ds.indexes['x'].slice_indexer(xmin, xmax)
+
+    return slice(*y.indices(ds.sizes['y'])[:2]), slice(*x.indices(ds.sizes['x'])[:2])
+
+
+_SLD_INTERVALS = {'Global-Land-Cover': '<RasterSymbolizer>' + '<ColorMap type="values" extended="false">' +
+                                       '<ColorMapEntry color="#ffff64" quantity="10" />' +
+                                       '<ColorMapEntry color="#ffff64" quantity="11" />' +
+                                       '<ColorMapEntry color="#ffff00" quantity="12" />' +
+                                       '<ColorMapEntry color="#aaf0f0" quantity="20" />' +
+                                       '<ColorMapEntry color="#dcf064" quantity="30" />' +
+                                       '<ColorMapEntry color="#c8c864" quantity="40" />' +
+                                       '<ColorMapEntry color="#006400" quantity="50" />' +
+                                       '<ColorMapEntry color="#00a000" quantity="60" />' +
+                                       '<ColorMapEntry color="#00a000" quantity="61" />' +
+                                       '<ColorMapEntry color="#aac800" quantity="62" />' +
+                                       '<ColorMapEntry color="#003c00" quantity="70" />' +
+                                       '<ColorMapEntry color="#003c00" quantity="71" />' +
+                                       '<ColorMapEntry color="#005000" quantity="72" />' +
+                                       '<ColorMapEntry color="#285000" quantity="80" />' +
+                                       '<ColorMapEntry color="#285000" quantity="81" />' +
+                                       '<ColorMapEntry color="#286400" quantity="82" />' +
+                                       '<ColorMapEntry color="#788200" quantity="90" />' +
+                                       '<ColorMapEntry color="#8ca000" quantity="100" />' +
+                                       '<ColorMapEntry color="#be9600" quantity="110" />' +
+                                       '<ColorMapEntry color="#966400" quantity="120" />' +
+                                       '<ColorMapEntry color="#966400" quantity="121" />' +
+                                       '<ColorMapEntry color="#966400" quantity="122" />' +
+                                       '<ColorMapEntry color="#ffb432" quantity="130" />' +
+                                       '<ColorMapEntry color="#ffdcd2" quantity="140" />' +
+                                       '<ColorMapEntry color="#ffebaf" quantity="150" />' +
+                                       '<ColorMapEntry color="#ffc864" quantity="151" />' +
+                                       '<ColorMapEntry color="#ffd278" quantity="152" />' +
+                                       '<ColorMapEntry color="#ffebaf" quantity="153" />' +
+                                       '<ColorMapEntry color="#00785a" quantity="160" />' +
+                                       '<ColorMapEntry color="#009678" quantity="170" />' +
+                                       '<ColorMapEntry color="#00dc82" quantity="180" />' +
+                                       '<ColorMapEntry color="#c31400" quantity="190" />' +
+                                       '<ColorMapEntry color="#fff5d7" quantity="200" />' +
+                                       '<ColorMapEntry color="#dcdcdc" quantity="201" />' +
+                                       '<ColorMapEntry color="#fff5d7" quantity="202" />' +
+                                       '<ColorMapEntry color="#0046c8" quantity="210" opacity="0" />' +
+                                       '<ColorMapEntry color="#ffffff" quantity="220" />' +
+                                       '</ColorMap>' + '</RasterSymbolizer>',
+                  'SOC-Stock-Change': '<RasterSymbolizer>' + '<ColorMap extended="false" type="ramp">' +
+                                      '<ColorMapEntry color="#B30200" quantity="-10"  opacity="1" />' +
+                                      '<ColorMapEntry color="#E34A33" quantity="-7.5"  />' +
+                                      '<ColorMapEntry color="#FC8D59" quantity="-5" />' +
+                                      '<ColorMapEntry color="#FDCC8A" quantity="-2.5"  />' +
+                                      '<ColorMapEntry color="#FFFFCC" quantity="0"  />' +
+                                      '<ColorMapEntry color="#A1DAB4" quantity="2.5" />' +
+                                      '<ColorMapEntry color="#31B3BD" quantity="5"  />' +
+                                      '<ColorMapEntry color="#1C9099" quantity="7.5" />' +
+                                      '<ColorMapEntry color="#066C59" quantity="10"  />' +
+                                      '</ColorMap>' + '</RasterSymbolizer>'
+                  }
+
+_CLASS_COLORS = {'Global-Land-Cover': {"10": "#ffff64", "11": "#ffff64", "12": "#ffff00", "20": "#aaf0f0",
+                                       "30": "#dcf064", "40": "#c8c864", "50": "#006400", "60": "#00a000",
+                                       "61": "#00a000", "62": "#aac800", "70": "#003c00", "71": "#003c00",
+                                       "72": "#005000", "80": "#285000", "81": "#285000", "82": "#286400",
+                                       "90": "#788200", "100": "#8ca000", "110": "#be9600", "120": "#966400",
+                                       "121": "#966400", "122": "#966400", "130": "#ffb432", "140": "#ffdcd2",
+                                       "150": "#ffebaf", "151": "#ffc864", "152": "#ffd278", "153": "#ffebaf",
+                                       "160": "#00785a", "170": "#009678", "180": "#00dc82", "190": "#c31400",
+                                       "200": "#fff5d7", "201": "#dcdcdc", "202": "#fff5d7", "210": "#0046c8",
+                                       "220": "#ffffff"},
+                 'SOC-Stock-Change': {}
+                 }
+
+_CLASS_NAMES = {'Global-Land-Cover': {"10": "Cropland, rainfed",
                                       "11": "Cropland, rainfed, herbaceous cover",
                                       "12": "Cropland, rainfed, tree, or shrub cover",
                                       "20": "Cropland, irrigated or post-flooding",
@@ -170,66 +304,153 @@ class GEEData:
                                       "210": "Water bodies",
                                       "220": "Permanent snow and ice "},
                 'SOC-Stock-Change': {}
+                }
+
+_CLASS_GROUP_NAMES = {'Global-Land-Cover': {"0": "No Data",
+                                            "10": "Cropland",
+                                            "11": "Cropland",
+                                            "12": "Cropland",
+                                            "20": "Cropland",
+                                            "30": "Cropland",
+                                            "40": "Cropland",
+                                            "50": "Tree cover",
+                                            "60": "Tree cover",
+                                            "61": "Tree cover",
+                                            "62": "Tree cover",
+                                            "70": "Tree cover",
+                                            "71": "Tree cover",
+                                            "72": "Tree cover",
+                                            "80": "Tree cover",
+                                            "81": "Tree cover",
+                                            "82": "Tree cover",
+                                            "90": "Tree cover",
+                                            "100": "Shrubland",
+                                            "110": "Shrubland",
+                                            "120": "Shrubland",
+                                            "121": "Shrubland",
+                                            "122": "Shrubland",
+                                            "130": "Grassland",
+                                            "140": "Lichens and mosses",
+                                            "150": "Sparse vegetation",
+                                            "152": "Sparse vegetation",
+                                            "153": "Sparse vegetation",
+                                            "160": "Flooded areas",
+                                            "170": "Flooded areas",
+                                            "180": "Flooded areas",
+                                            "190": "Urban areas",
+                                            "200": "Bare areas",
+                                            "201": "Bare areas",
+                                            "202": "Bare areas",
+                                            "210": "Water bodies",
+                                            "220": "Snow and ice"},
+                      'SOC-Stock-Change': {}
+                      }
+
+_CLASS_GROUP_COLORS = {'Global-Land-Cover': {"No Data": "#ffffff",
+                                             "Cropland": "#ffff64",
+                                             "Tree cover": "#003c00",
+                                             "Shrubland": "#966400",
+                                             "Grassland": "#ffb432",
+                                             "Lichens and mosses": "#ffdcd2",
+                                             "Sparse vegetation": "#ffebaf",
+                                             "Flooded areas": "#009678",
+                                             "Urban areas": "#c31400",
+                                             "Bare areas": "#fff5d7",
+                                             "Water bodies": "#0046c8",
+                                             "Snow and ice": "#ffffff"
+                                             },
+                       'SOC-Stock-Change': {}
+                       }
+
+
+NO_GROUP = 255
+
+
+@dataclass(frozen=True)
+class ClassMetadata:
+    """
+    Class metadata of a dataset, compiled once into read-only lookup structures.
+
+    code_to_group (np.ndarray): uint8 array mapping every class code (0-255) to a group index, NO_GROUP if none.
+    group_names (tuple): Group index -> group name.
+    group_colors (tuple): Group index -> hex color.
+    group_rgb (np.ndarray): Group index -> uint8 RGB color.
+    """
+    code_to_group: np.ndarray
+    group_names: tuple
+    group_colors: tuple
+    group_rgb: np.ndarray
+    class_names: MappingProxyType
+    class_colors: MappingProxyType
+    class_group_names: MappingProxyType
+    class_group_colors: MappingProxyType
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+@lru_cache(maxsize=None)
+def compile_class_metadata(dataset):
+    class_group_names = _CLASS_GROUP_NAMES[dataset]
+    class_group_colors = _CLASS_GROUP_COLORS[dataset]
+    group_names = tuple(dict.fromkeys(class_group_names.values()))
+
+    code_to_group = np.full(256, NO_GROUP, dtype=np.uint8)
+    for code, name in class_group_names.items():
+        code_to_group[int(code)] = group_names.index(name)
+
+    group_colors = tuple(class_group_colors[name] for name in group_names)
+    group_rgb = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in group_colors],
+                         dtype=np.uint8).reshape(-1, 3)
+
+    return ClassMetadata(code_to_group=_read_only(code_to_group),
+                         group_names=group_names,
+                         group_colors=group_colors,
+                         group_rgb=_read_only(group_rgb),
+                         class_names=MappingProxyType(_CLASS_NAMES[dataset]),
+                         class_colors=MappingProxyType(_CLASS_COLORS[dataset]),
+                         class_group_names=MappingProxyType(class_group_names),
+                         class_group_colors=MappingProxyType(class_group_colors))
+
+
+@dataclass
+class GEEData:
+    dataset: str
+
+    def image_collection_id(self):
+        return {'Global-Land-Cover': 'projects/soils-revealed/ESA_landcover_ipcc',
+                'SOC-Stock-Change': 'projects/soils-revealed/Recent/SOC_stocks'}[self.dataset]
+
+    def ee_image(self, year='2018'):
+        return {'Global-Land-Cover': ee.Image(ee.ImageCollection(self.image_collection_id()).
+                                              filterDate(f'{year}-01-01', f'{year}-12-31').first()),
+                'SOC-Stock-Change': ee.ImageCollection('projects/soils-revealed/Recent/SOC_stock_nov2020').filterDate(
+                    '2018-01-01', '2018-12-31').first().subtract(
+                    ee.ImageCollection('projects/soils-revealed/Recent/SOC_stock_nov2020').filterDate(
+                        '2000-01-01', '2000-12-31').first())
                 }[self.dataset]
 
+    def class_metadata(self):
+        return compile_class_metadata(self.dataset)
+
+    def sld_interval(self):
+        return _SLD_INTERVALS[self.dataset]
+
+    def class_colors(self):
+        return self.class_metadata().class_colors
+
+    def class_names(self):
+        return self.class_metadata().class_names
+
     def class_group_names(self):
-        return {'Global-Land-Cover': {"0": "No Data",
-                                      "10": "Cropland",
-                                      "11": "Cropland",
-                                      "12": "Cropland",
-                                      "20": "Cropland",
-                                      "30": "Cropland",
-                                      "40": "Cropland",
-                                      "50": "Tree cover",
-                                      "60": "Tree cover",
-                                      "61": "Tree cover",
-                                      "62": "Tree cover",
-                                      "70": "Tree cover",
-                                      "71": "Tree cover",
-                                      "72": "Tree cover",
-                                      "80": "Tree cover",
-                                      "81": "Tree cover",
-                                      "82": "Tree cover",
-                                      "90": "Tree cover",
-                                      "100": "Shrubland",
-                                      "110": "Shrubland",
-                                      "120": "Shrubland",
-                                      "121": "Shrubland",
-                                      "122": "Shrubland",
-                                      "130": "Grassland",
-                                      "140": "Lichens and mosses",
-                                      "150": "Sparse vegetation",
-                                      "152": "Sparse vegetation",
-                                      "153": "Sparse vegetation",
-                                      "160": "Flooded areas",
-                                      "170": "Flooded areas",
-                                      "180": "Flooded areas",
-                                      "190": "Urban areas",
-                                      "200": "Bare areas",
-                                      "201": "Bare areas",
-                                      "202": "Bare areas",
-                                      "210": "Water bodies",
-                                      "220": "Snow and ice"},
-                'SOC-Stock-Change': {}
-                }[self.dataset]
+        return self.class_metadata().class_group_names
 
     def class_group_colors(self):
-        return {'Global-Land-Cover': {"No Data": "#ffffff",
-                                      "Cropland": "#ffff64",
-                                      "Tree cover": "#003c00",
-                                      "Shrubland": "#966400",
-                                      "Grassland": "#ffb432",
-                                      "Lichens and mosses": "#ffdcd2",
-                                      "Sparse vegetation": "#ffebaf",
-                                      "Flooded areas": "#009678",
-                                      "Urban areas": "#c31400",
-                                      "Bare areas": "#fff5d7",
-                                      "Water bodies": "#0046c8",
-                                      "Snow and ice": "#ffffff"
-                                      },
-                'SOC-Stock-Change': {}
-                }[self.dataset]
-    
+        return self.class_metadata().class_group_colors
+
+
 @dataclass
 class SatelliteImageryData:
     dataset: str = None
@@ -0,0 +1,122 @@
+import dask
+import dask.array as da
+import numpy as np
+
+from soils_revealed.transitions import N_GROUPS, group_index, matrix_to_data, tree_reduce
+
+TOTAL = 'total'
+
+
+def depth_matrices(stocks, land_cover, weights=None, mask=None):
+    """
+    Transition matrices of every depth interval and of their depth-integrated total, in one pass.
+
+    The land cover transition of every pixel is grouped once and shared by all depths. As in
+    `transitions.transition_matrix`, a pixel counts at a depth when its land cover code and its
+    stocks at that depth changed. The total sums the change of all depths of a pixel.
+
+    Parameters:
+    stocks (np.ndarray): (depth, time, y, x) stocks, time holding 2000 and 2018.
+    land_cover (np.ndarray): (time, y, x) land cover codes.
+    weights (np.ndarray): Optional per-pixel weights broadcast against (y, x).
+    mask (np.ndarray): Optional boolean (y, x) mask of the pixels to count.
+
+    Returns:
+    (sums, counts): float64 and int64 arrays of shape (depth + 1, N_GROUPS, N_GROUPS), the last
+        one being the total.
+    """
+    n_depths, n_bins = stocks.shape[0], N_GROUPS * N_GROUPS
+
+    keep = (land_cover[0] != land_cover[1]).ravel()
+    if mask is not None:
+        keep &= np.asarray(mask).ravel()
+    index = group_index(land_cover[0].ravel()[keep]) * N_GROUPS + group_index(land_cover[1].ravel()[keep])
+
+    change = np.subtract(stocks[:, 1], stocks[:, 0], dtype=np.float64).reshape(n_depths, -1)[:, keep]
+    if weights is not None:
+        change *= np.broadcast_to(weights, stocks.shape[2:]).ravel()[keep]
+
+    # The total is one more layer, NaN only where every depth is NaN
+    total = np.where(np.isnan(change).all(axis=0), np.nan, np.nansum(change, axis=0))
+    change = np.concatenate([change, total[None]])
+
+    # One bincount for all layers, layer d filling bins [d * n_bins, (d + 1) * n_bins)
+    bins = np.arange(n_depths + 1)[:, None] * n_bins + index
+    counted = change != 0.
+    # NaN changes make the transition show up but do not add to its sum
+    values = np.nan_to_num(change[counted], nan=0.)
+
+    sums = np.bincount(bins[counted], weights=values, minlength=(n_depths + 1) * n_bins)
+    counts = np.bincount(bins[counted], minlength=(n_depths + 1) * n_bins)
+
+    return sums.reshape(-1, N_GROUPS, N_GROUPS), counts.reshape(-1, N_GROUPS, N_GROUPS).astype(np.int64)
+
+
+def _block_depth_matrices(stocks, land_cover, row_weights=None, mask=None):
+    weights = None if row_weights is None else np.asarray(row_weights)[:, None]
+
+    return depth_matrices(stocks, land_cover, weights=weights, mask=mask)
+
+
+def reduce_depths(ds, variable, depths=None, split_every=8, row_weights=None, mask=None):
+    """
+    Per-depth and depth-integrated transition matrices of a dataset, reading every chunk once.
+
+    Parameters:
+    ds (xr.Dataset): Dataset as returned by `read_depth_ds`, `variable` over (depth, time, y, x)
+        and `land-cover` over (time, y, x).
+    variable (str): Depth-resolved stocks variable.
+    depths (list): Depth intervals to select, all by default.
+    split_every (int): Fan-in of the tree reduction.
+    row_weights (np.ndarray): Optional weight of every row of `ds`, see `transitions.reduce_chunks`.
+    mask (np.ndarray): Optional boolean (y, x) mask of the pixels to count.
+
+    Returns:
+    (depths, sums, counts): the selected depth values and the stacked matrices of `depth_matrices`.
+    """
+    if 'depth' not in ds[variable].dims:
+        raise ValueError(f"'{variable}' has no depth dimension, dimensions are {ds[variable].dims}")
+
+    stocks = ds[variable] if depths is None else ds[variable].sel(depth=depths)
+    depths = stocks['depth'].values.tolist()
+    stocks = stocks.transpose('depth', 'time', 'y', 'x').data
+    land_cover = ds['land-cover'].transpose('time', 'y', 'x').data
+
+    if not (dask.is_dask_collection(stocks) or dask.is_dask_collection(land_cover)):
+        return (depths,) + _block_depth_matrices(np.asarray(stocks), np.asarray(land_cover), row_weights, mask)
+
+    # Every depth of a pixel in the same block as its land cover
+    stocks = da.asarray(stocks).rechunk({0: -1, 1: -1})
+    land_cover = da.asarray(land_cover).rechunk({0: -1})
+    _, (stocks, land_cover) = da.core.unify_chunks(stocks, 'dtyx', land_cover, 'tyx')
+
+    row_bounds = np.cumsum((0,) + stocks.chunks[2])
+    column_bounds = np.cumsum((0,) + stocks.chunks[3])
+
+    partials = []
+    for (_, _, row, column), stocks_block, land_cover_block in zip(np.ndindex(stocks.numblocks),
+                                                                   stocks.to_delayed().ravel(),
+                                                                   land_cover.to_delayed().ravel()):
+        rows = slice(row_bounds[row], row_bounds[row + 1])
+        block_mask = None if mask is None else mask[rows, column_bounds[column]:column_bounds[column + 1]]
+        if block_mask is not None and not block_mask.any():
+            continue
+        block_weights = None if row_weights is None else np.asarray(row_weights)[rows]
+
+        partials.append(dask.delayed(_block_depth_matrices)(stocks_block, land_cover_block, block_weights,
+                                                            block_mask))
+
+    if not partials:
+        shape = (len(depths) + 1, N_GROUPS, N_GROUPS)
+        return depths, np.zeros(shape, dtype=np.float64), np.zeros(shape, dtype=np.int64)
+
+    return (depths,) + dask.compute(tree_reduce(partials, split_every=split_every))[0]
+
+
+def get_data_by_depth(ds, variable, depths=None, **kwargs):
+    """
+    {depth: {lc_2018: {lc_2000: sum}}} of every selected depth, plus the depth-integrated `TOTAL`.
+    """
+    depths, sums, counts = reduce_depths(ds, variable, depths=depths, **kwargs)
+
+    return {key: matrix_to_data(sums[n], counts[n]) for n, key in enumerate(depths + [TOTAL])}
@@ -0,0 +1,134 @@
+import argparse
+import logging
+import os
+
+import dask
+import dask.array as da
+import numpy as np
+import xarray as xr
+import zarr
+
+from soils_revealed.data_params import bbox_indexer, read_ds
+from soils_revealed.transitions import GROUP_NAMES, N_GROUPS, empty_matrix, group_index, matrix_to_data, \
+    reduce_chunks
+
+# Every query reads 4 corners of each table, and a corner decodes the whole (y, x) chunk around it
+INDEX_CHUNKS = 16
+
+
+def _pair_block(stocks, land_cover, pair_lookup, n_pairs, counts):
+    """
+    Spread the stock change (or a count of 1) of every changed pixel over its transition pair axis.
+    """
+    change = np.subtract(stocks[1], stocks[0], dtype=np.float64)
+    keep = (land_cover[0] != land_cover[1]) & (change != 0.)
+    rows, cols = np.nonzero(keep)
+    pair = pair_lookup[group_index(land_cover[0][keep]) * N_GROUPS + group_index(land_cover[1][keep])]
+
+    out = np.zeros(change.shape + (n_pairs,), dtype=np.int64 if counts else np.float64)
+    out[rows, cols, pair] = 1 if counts else np.nan_to_num(change[keep], nan=0.)
+
+    return out
+
+
+def build_index(ds, store, chunks=INDEX_CHUNKS):
+    """
+    Write a summed-area table (integral image) of stock change per land cover transition.
+
+    `sums[r, c]` holds the float64 stock change of all pixels above row r and left of
+    column c, `counts[r, c]` the number of those pixels. Only the transition pairs that
+    occur in `ds` get a layer.
+
+    Parameters:
+    ds (xr.Dataset): Full dataset as returned by `read_ds`.
+    store (str or MutableMapping): Zarr store to write the index to.
+    chunks (int): Chunk size of the index along y and x. Small chunks keep point lookups cheap
+        (a corner decodes chunks * chunks * pairs values) at the cost of more chunk files.
+    """
+    _, pair_counts = reduce_chunks(ds)
+    pairs = np.flatnonzero(pair_counts.ravel())
+    pair_lookup = np.full(N_GROUPS * N_GROUPS, -1, dtype=np.intp)
+    pair_lookup[pairs] = np.arange(pairs.size)
+
+    stocks = da.asarray(ds['stocks'].transpose('time', 'y', 'x').data).rechunk({0: -1})
+    land_cover = da.asarray(ds['land-cover'].transpose('time', 'y', 'x').data).rechunk({0: -1})
+    _, (stocks, land_cover) = da.core.unify_chunks(stocks, 'tyx', land_cover, 'tyx')
+
+    root = zarr.open_group(store, mode='w')
+    root.attrs.update({'group_names': list(GROUP_NAMES), 'pairs': pairs.tolist()})
+    root.array('y', ds['y'].values)
+    root.array('x', ds['x'].values)
+
+    writes = []
+    for name, counts in [('sums', False), ('counts', True)]:
+        layers = da.map_blocks(_pair_block, stocks, land_cover, pair_lookup=pair_lookup, n_pairs=pairs.size,
+                               counts=counts, drop_axis=0, new_axis=2,
+                               chunks=stocks.chunks[1:] + ((pairs.size,),),
+                               dtype=np.int64 if counts else np.float64)
+        table = da.pad(layers.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0), (0, 0)))
+        writes.append(da.to_zarr(table.rechunk((chunks, chunks, pairs.size)), store, component=name,
+                                 overwrite=True, compute=False))
+
+    dask.compute(*writes)
+
+    return SummedAreaIndex(store)
+
+
+class SummedAreaIndex:
+    """
+    Answer bbox queries with four lookups into a summed-area table written by `build_index`.
+    """
+
+    def __init__(self, store):
+        root = zarr.open_group(store, mode='r')
+        if tuple(root.attrs['group_names']) != GROUP_NAMES:
+            raise ValueError("Index was built with different land cover groups.")
+
+        self.pairs = np.asarray(root.attrs['pairs'], dtype=np.intp)
+        self.sums = root['sums']
+        self.counts = root['counts']
+        self.grid = xr.Dataset(coords={'y': root['y'][:], 'x': root['x'][:]})
+
+    def query(self, bbox):
+        """
+        Transition matrix of a bbox.
+
+        Parameters:
+        bbox (tuple): (xmin, ymin, xmax, ymax).
+
+        Returns:
+        (sums, counts) as returned by `transitions.transition_matrix`.
+        """
+        y, x = bbox_indexer(self.grid, bbox)
+        sums, counts = empty_matrix()
+        if y.start >= y.stop or x.start >= x.stop:
+            return sums, counts
+
+        for table, matrix in [(self.sums, sums), (self.counts, counts)]:
+            # The 2 x 2 corners in one selection, their chunks fetched together
+            corners = table.get_orthogonal_selection(([y.start, y.stop], [x.start, x.stop], slice(None)))
+            matrix.ravel()[self.pairs] = corners[1, 1] - corners[0, 1] - corners[1, 0] + corners[0, 0]
+
+        return sums, counts
+
+    def get_data(self, bbox):
+        """
+        Same nested dict as `processing.get_data` for the pixels inside bbox.
+        """
+        return matrix_to_data(*self.query(bbox))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the summed-area table index from the S3 zarr stores.")
+    parser.add_argument('output', help="Path of the zarr store to write.")
+    parser.add_argument('--chunks', type=int, default=INDEX_CHUNKS, help="Chunk size of the index along y and x.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ds = read_ds(access_key_id=os.environ['S3_ACCESS_KEY_ID'],
+                 secret_accsess_key=os.environ['S3_SECRET_ACCESS_KEY'])
+    build_index(ds, store=args.output, chunks=args.chunks)
+
+
+if __name__ == "__main__":
+    main()
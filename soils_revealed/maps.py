@@ -1,14 +1,103 @@
+import hashlib
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import List
 
 import ee
+from cachetools import TTLCache
 import folium
 from folium.plugins import Draw
 import ipyleaflet as ipyl
 from shapely.geometry import Polygon
 
+# Earth Engine map ids stay valid for a few hours, reuse them for an hour
+TILE_URL_TTL = 3600
+TILE_URL_WORKERS = 8
 
-class LeafletMap(ipyl.Map):
+_tile_urls = TTLCache(maxsize=256, ttl=TILE_URL_TTL)
+_tile_urls_lock = threading.Lock()
+
+
+@dataclass
+class GEELayer:
+    """
+    A GEE layer to add to a map.
+
+    image (ee.Image): The Earth Engine image to display.
+    sld_interval (str): SLD style of discrete intervals to apply to the image.
+    name (str): Layer name.
+    """
+    image: ee.Image
+    sld_interval: str
+    name: str
+
+
+def _tile_url_key(layer: GEELayer) -> str:
+    # Serializing an image is local, it does not call Earth Engine
+    return hashlib.sha256((str(layer.image.serialize()) + layer.sld_interval).encode()).hexdigest()
+
+
+def _fetch_tile_url(layer: GEELayer) -> str:
+    ee_tiles = '{tile_fetcher.url_format}'
+
+    image = layer.image.sldStyle(layer.sld_interval)
+    mapid = image.getMapId()
+
+    return ee_tiles.format(**mapid)
+
+
+def resolve_tile_urls(layers: List[GEELayer], max_workers: int = TILE_URL_WORKERS) -> List[str]:
+    """
+    Tile URLs of GEE layers, in order.
+
+    Cached URLs are reused, the others are requested from Earth Engine concurrently.
+    """
+    keys = [_tile_url_key(layer) for layer in layers]
+    with _tile_urls_lock:
+        urls = [_tile_urls.get(key) for key in keys]
+
+    missing = [n for n, url in enumerate(urls) if url is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            fetched = list(executor.map(_fetch_tile_url, [layers[n] for n in missing]))
+
+        with _tile_urls_lock:
+            for n, url in zip(missing, fetched):
+                urls[n] = _tile_urls[keys[n]] = url
+
+    return urls
+
+
+class GEELayersMixin:
+    """
+    GEE layer registration shared by the map classes, which implement `add_tile_layer(tiles_url, name)`.
+    """
+
+    def add_gee_layer(self, image: ee.Image, sld_interval: str, name: str):
+        """
+        Add GEE layer to map.
+
+        Parameters:
+        image (ee.Image): The Earth Engine image to display.
+        sld_interval (str): SLD style of discrete intervals to apply to the image.
+        name (str): lLayer name.
+        """
+        self.add_gee_layers([GEELayer(image=image, sld_interval=sld_interval, name=name)])
+
+    def add_gee_layers(self, layers: List[GEELayer]):
+        """
+        Add several GEE layers to map, resolving their map ids concurrently.
+
+        Parameters:
+        layers (list): GEELayer objects, added in order.
+        """
+        for layer, tiles_url in zip(layers, resolve_tile_urls(layers)):
+            self.add_tile_layer(tiles_url=tiles_url, name=layer.name)
+
+
+class LeafletMap(GEELayersMixin, ipyl.Map):
     """
     A custom Map class.
 
@@ -86,21 +175,7 @@ class LeafletMap(ipyl.Map):
 
             self.geometry = feature_collection
 
-    def add_gee_layer(self, image: ee.Image, sld_interval: str, name: str):
-        """
-        Add GEE layer to map.
-
-        Parameters:
-        image (ee.Image): The Earth Engine image to display.
-        sld_interval (str): SLD style of discrete intervals to apply to the image.
-        name (str): lLayer name.
-        """
-        ee_tiles = '{tile_fetcher.url_format}'
-
-        image = image.sldStyle(sld_interval)
-        mapid = image.getMapId()
-        tiles_url = ee_tiles.format(**mapid)
-
+    def add_tile_layer(self, tiles_url: str, name: str):
         layer = ipyl.TileLayer(url=tiles_url, name=name)
         self.add_layer(layer)
 
@@ -138,7 +213,7 @@ class LeafletMap(ipyl.Map):
         
 
 
-class MapGEE(folium.Map):
+class MapGEE(GEELayersMixin, folium.Map):
     """
     A custom Map class that can display Google Earth Engine tiles.
 
@@ -172,7 +247,7 @@ class MapGEE(folium.Map):
                 "polyline": False,
                 "poly": False,
                 "circle": False,
-                "polygon": False,
+                "polygon": True,
                 "marker": False,
                 "circlemarker": False,
                 "rectangle": True
@@ -181,21 +256,7 @@ class MapGEE(folium.Map):
 
         draw.add_to(self)
 
-    def add_gee_layer(self, image: ee.Image, sld_interval: str, name: str):
-        """
-        Add GEE layer to map.
-
-        Parameters:
-        image (ee.Image): The Earth Engine image to display.
-        sld_interval (str): SLD style of discrete intervals to apply to the image.
-        name (str): lLayer name.
-        """
-        ee_tiles = '{tile_fetcher.url_format}'
-
-        image = image.sldStyle(sld_interval)
-        mapid = image.getMapId()
-        tiles_url = ee_tiles.format(**mapid)
-
+    def add_tile_layer(self, tiles_url: str, name: str):
         tile_layer = folium.TileLayer(
             tiles=tiles_url,
             name=name,
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+from rasterio.features import geometry_mask
+from rasterio.transform import Affine
+from shapely.geometry import mapping, shape
+
+from soils_revealed.data_params import bbox_indexer
+
+# Rasterized masks by geometry and grid, shared by all sessions of the process
+_masks = LRUCache(maxsize=32)
+_masks_lock = threading.Lock()
+
+
+def as_shape(geometry):
+    """
+    Shapely geometry of a GeoJSON geometry dict, or the geometry itself if it already is one.
+    """
+    return shape(geometry) if isinstance(geometry, dict) else geometry
+
+
+def geometry_key(geometry):
+    """
+    Stable hash of a (multi)polygon, independent of the key order of its GeoJSON.
+    """
+    return hashlib.sha1(json.dumps(mapping(as_shape(geometry)), sort_keys=True).encode()).hexdigest()
+
+
+def is_rectangle(geometry, rtol=1e-9):
+    """
+    Whether a geometry is an axis-aligned rectangle, i.e. covers its whole bounding box.
+    """
+    geometry = as_shape(geometry)
+    return geometry.geom_type == 'Polygon' and not geometry.interiors and \
+        abs(geometry.envelope.area - geometry.area) <= rtol * geometry.envelope.area
+
+
+def _grid_key(ds):
+    y, x = ds['y'].values, ds['x'].values
+    return y.size, x.size, float(y[0]), float(y[-1]), float(x[0]), float(x[-1])
+
+
+def rasterize(ds, geometry):
+    """
+    Rasterize a geometry onto the pixel grid of `ds`.
+
+    Pixels are selected when their center falls inside the geometry, as `ds.sel` does for
+    the corners of a bbox.
+
+    Parameters:
+    ds (xr.Dataset): Dataset with regular `x` and `y` coordinates.
+    geometry: GeoJSON geometry dict or shapely (multi)polygon.
+
+    Returns:
+    (y, x, mask): positional slices of the bounding box of the geometry and the boolean
+        (y, x) mask of its pixels inside that window.
+    """
+    geometry = as_shape(geometry)
+    y, x = bbox_indexer(ds, geometry.bounds)
+    ys, xs = ds['y'].values[y], ds['x'].values[x]
+
+    if ys.size == 0 or xs.size == 0:
+        return y, x, np.zeros((ys.size, xs.size), dtype=bool)
+
+    dy = (ds['y'].values[-1] - ds['y'].values[0]) / (ds.sizes['y'] - 1) if ds.sizes['y'] > 1 else -1.
+    dx = (ds['x'].values[-1] - ds['x'].values[0]) / (ds.sizes['x'] - 1) if ds.sizes['x'] > 1 else 1.
+    transform = Affine(dx, 0., xs[0] - dx / 2, 0., dy, ys[0] - dy / 2)
+
+    mask = geometry_mask([geometry], out_shape=(ys.size, xs.size), transform=transform, invert=True)
+
+    return y, x, mask
+
+
+def get_mask(ds, geometry):
+    """
+    Cached `rasterize`, keyed by geometry hash and grid. The returned mask is read-only.
+    """
+    key = (geometry_key(geometry), _grid_key(ds))
+    with _masks_lock:
+        cached = _masks.get(key)
+    if cached is not None:
+        return cached
+
+    y, x, mask = rasterize(ds, geometry)
+    mask.setflags(write=False)
+    with _masks_lock:
+        _masks[key] = y, x, mask
+
+    return y, x, mask
@@ -1,96 +1,100 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import hashlib
+import io
+import json
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 from soils_revealed.data_params import GEEData
+from soils_revealed.sketches import TransitionSketch, block_sketch, merge_sketches
+from soils_revealed.transitions import GROUP_NAMES, matrix_to_data, reduce_chunks, transition_matrix
 
 dataset = GEEData('Global-Land-Cover')
 
+# Below this many pixels get_data skips the per-chunk tasks of the chunked reduction
+NUMPY_MAX_PIXELS = 4_000_000
+
+# Rendered plots by data hash, drawn on one reused Agg figure
+_renders = LRUCache(maxsize=128)
+_render_figure = Figure()
+FigureCanvasAgg(_render_figure)
+_render_lock = threading.Lock()
+
+
+def get_data(ds, row_weights=None, mask=None, max_numpy_pixels=NUMPY_MAX_PIXELS):
+    # Large selections are reduced chunk by chunk, see benchmarks/get_data_crossover.py. So are masked
+    # ones, whose chunks without any masked pixel are then never read.
+    if mask is not None or ds.sizes['y'] * ds.sizes['x'] > max_numpy_pixels:
+        return get_data_chunked(ds, row_weights=row_weights, mask=mask)
 
-def get_data(ds):
-    df = ds.isel(time=0).to_dataframe().reset_index().drop(
-        columns=['x', 'y', 'time']).rename(
-        columns={'stocks': 'stocks_2000', 'land-cover': 'land-cover_2000'})
+    # Small ones are read at once into two numpy arrays and reduced in a single call
+    stocks = ds['stocks'].transpose('time', 'y', 'x').values
+    land_cover = ds['land-cover'].transpose('time', 'y', 'x').values
 
-    df = pd.concat([df,
-                    ds.isel(time=1).to_dataframe().reset_index().drop(
-                        columns=['x', 'y', 'time']).rename(
-                        columns={'stocks': 'stocks_2018', 'land-cover': 'land-cover_2018'})], axis=1)
+    sums, counts = transition_matrix(stocks_2000=stocks[0], stocks_2018=stocks[1],
+                                     lc_2000=land_cover[0], lc_2018=land_cover[1],
+                                     weights=None if row_weights is None else np.asarray(row_weights)[:, None],
+                                     mask=mask)
 
-    # Filter rows where columns A and B have equal values
-    df = df[df['land-cover_2000'] != df['land-cover_2018']]
-    df['stocks_change'] = df['stocks_2018'] - df['stocks_2000']
-    df = df[df['stocks_change'] != 0.]
-    df = df[['land-cover_2018', 'land-cover_2000', 'stocks_change']]
-    df['land-cover_2000'] = df['land-cover_2000'].apply(
-        lambda x: dataset.class_group_names()[str(x)])
-    df['land-cover_2018'] = df['land-cover_2018'].apply(
-        lambda x: dataset.class_group_names()[str(x)])
+    return matrix_to_data(sums, counts)
 
-    # Grouping the DataFrame by 'land-cover_2000' and 'land-cover_2018' and summing 'stocks_change'
-    grouped_df = df.groupby(['land-cover_2000', 'land-cover_2018'])['stocks_change'].sum().reset_index()
-    grouped_2018_df = grouped_df.groupby(['land-cover_2018'])['stocks_change'].sum().reset_index()
 
-    data = {}
-    for category in grouped_2018_df.sort_values('stocks_change')['land-cover_2018']:
-        records = grouped_df[grouped_df['land-cover_2018'] == category].sort_values('stocks_change')
-        records = dict(zip(records['land-cover_2000'], records['stocks_change']))
+def get_data_chunked(ds, split_every=8, row_weights=None, mask=None):
+    sums, counts = reduce_chunks(ds, split_every=split_every, row_weights=row_weights, mask=mask)
 
-        data[category] = records
+    return matrix_to_data(sums, counts)
 
-    return data
 
+def get_data_stats(ds, split_every=8, row_weights=None, mask=None):
+    """
+    Same reduction as `get_data_chunked`, returning a `sketches.TransitionSketch` with the per-transition
+    pixel count, mean, variance and quantiles next to the sums (`.data()`).
+    """
+    return reduce_chunks(ds, split_every=split_every, row_weights=row_weights, mask=mask,
+                         block_function=block_sketch, combine=merge_sketches, empty=TransitionSketch.empty)
 
-def get_plot(data):
+
+def get_plot(data, fig=None, units='t C/ha', errors=None):
     categories = list(data.keys())
 
-    lists_labels = [list(value.keys()) for value in data.values()]
-    labels = list(set([item for sublist in lists_labels for item in sublist]))
+    # Land cover 2000 groups present in the data, in group order
+    labels = [name for name in GROUP_NAMES if any(name in value for value in data.values())]
 
     land_cover_colors = dataset.class_group_colors()
 
+    # Dense (categories x labels) matrix, bars drawn bottom-up so the first category ends on top
+    values = np.array([[data[category].get(label, 0.) for label in labels] for category in categories[::-1]],
+                      dtype=np.float64).reshape(len(categories), len(labels))
+    values_positive = np.clip(values, 0., None)
+    values_negative = np.clip(values, None, 0.)
+
+    # Running offsets of the stacked segments on each side of 0
+    left_positive = np.cumsum(values_positive, axis=1) - values_positive
+    left_negative = np.cumsum(values_negative, axis=1) - values_negative
+
     # Calculate the positions of the bars on the y-axis
-    bar_positions = range(len(categories))
+    bar_positions = np.arange(len(categories))
 
-    # Create the plot
-    fig, ax = plt.subplots()
+    # Create the plot, outside of pyplot so no global figure is left behind
+    if fig is None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+    fig.clear()
+    ax = fig.subplots()
 
     for n, label in enumerate(labels):
-        values_positive = []
-        values_negative = []
-        for category in categories[::-1]:
-            data_dict = data[category]
-            if label in data_dict.keys():
-                value = data_dict[label]
-                if value > 0:
-                    values_positive.append(value)
-                    values_negative.append(0)
-                else:
-                    values_negative.append(value)
-                    values_positive.append(0)
-            else:
-                values_negative.append(0)
-                values_positive.append(0)
-
-        if n == 0:
-            ax.barh(bar_positions, values_positive, label=label, color=land_cover_colors[label])
-            ax.barh(bar_positions, values_negative, color=land_cover_colors[label])
-
-            values_positive_pre = values_positive
-            values_negative_pre = values_negative
-        elif n == 1:
-            ax.barh(bar_positions, values_positive, left=values_positive_pre, label=label,
-                    color=land_cover_colors[label])
-            ax.barh(bar_positions, values_negative, left=values_negative_pre, color=land_cover_colors[label])
-
-            values_positive_pre = [values_positive_pre[i] + values_positive[i] for i in range(len(values_positive))]
-            values_negative_pre = [values_negative_pre[i] + values_negative[i] for i in range(len(values_negative))]
-        else:
-            ax.barh(bar_positions, values_positive, left=values_positive_pre, label=label,
-                    color=land_cover_colors[label])
-            ax.barh(bar_positions, values_negative, left=values_negative_pre, color=land_cover_colors[label])
-
-            values_positive_pre = [values_positive_pre[i] + values_positive[i] for i in range(len(values_positive))]
-            values_negative_pre = [values_negative_pre[i] + values_negative[i] for i in range(len(values_negative))]
+        ax.barh(np.concatenate([bar_positions, bar_positions]),
+                np.concatenate([values_positive[:, n], values_negative[:, n]]),
+                left=np.concatenate([left_positive[:, n], left_negative[:, n]]),
+                label=label, color=land_cover_colors[label])
+
+    # Error bars on the net change of every category, e.g. `TransitionSketch.total_errors()`
+    if errors:
+        ax.errorbar(values.sum(axis=1), bar_positions, xerr=[errors.get(category, 0.) for category in categories[::-1]],
+                    fmt='o', color='black', markersize=3, capsize=3)
 
     # Add a dashed line at x = 0
     ax.axvline(0, color='black', linestyle='dashed')
@@ -102,7 +106,7 @@ def get_plot(data):
     ax.set_ylabel('Land Cover 2018')
 
     # Set the x-axis label
-    ax.set_xlabel('SOC stock change (t C/ha)')
+    ax.set_xlabel(f'SOC stock change ({units})')
 
     # Remove the frame
     ax.spines['top'].set_visible(False)
@@ -116,6 +120,28 @@ def get_plot(data):
     legend.set_title('Land Cover 2000')
 
     # Expand the plot's size to accommodate the legend
-    plt.subplots_adjust(right=0.8)
+    fig.subplots_adjust(right=0.8)
+
+    return fig
+
+
+def _data_hash(data, errors=None):
+    return hashlib.sha256(json.dumps([data, errors]).encode()).hexdigest()
+
+
+def render_plot(data, format='png', units='t C/ha', errors=None):
+    """
+    Render the plot of a transition dict, with optional error bars, to PNG or SVG bytes.
+
+    Renders are cached by a hash of the data, and reuse a single Agg figure.
+    """
+    key = (_data_hash(data, errors), format, units)
+    with _render_lock:
+        if key not in _renders:
+            buffer = io.BytesIO()
+            get_plot(data, fig=_render_figure, units=units, errors=errors).savefig(buffer, format=format,
+                                                                                  bbox_inches='tight')
+            _render_figure.clear()
+            _renders[key] = buffer.getvalue()
 
-    return plt
+        return _renders[key]
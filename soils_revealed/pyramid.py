@@ -0,0 +1,189 @@
+import argparse
+import logging
+import os
+
+import dask
+import numpy as np
+import zarr
+
+from soils_revealed.data_params import bbox_indexer, read_ds
+from soils_revealed.transitions import GROUP_NAMES, N_GROUPS, block_matrix, empty_matrix, reduce_chunks
+
+log = logging.getLogger(__name__)
+
+TILE_CHUNKS = 16
+
+
+def _coarsen(array):
+    """
+    Sum 2x2 blocks of tiles, padding odd edges with zeros.
+    """
+    rows, cols = array.shape[:2]
+    padded = np.zeros((rows + rows % 2, cols + cols % 2) + array.shape[2:], dtype=array.dtype)
+    padded[:rows, :cols] = array
+
+    return padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+
+
+def build_pyramid(ds, store, tile_size=None, levels=None):
+    """
+    Write a multi-resolution pyramid of per-tile transition matrices.
+
+    Level 0 holds one (sums, counts) matrix per `tile_size` x `tile_size` pixel tile, every
+    following level sums 2x2 tiles of the previous one.
+
+    Parameters:
+    ds (xr.Dataset): Full dataset as returned by `read_ds`.
+    store (str or MutableMapping): Zarr store to write the pyramid to.
+    tile_size (int): Tile size in pixels. Defaults to the dataset chunk size.
+    levels (int): Number of levels. Defaults to coarsening until a single tile is left.
+    """
+    if tile_size is None:
+        tile_size = ds.chunks['y'][0] if ds.chunks else 256
+
+    stocks = ds['stocks'].transpose('time', 'y', 'x').data
+    land_cover = ds['land-cover'].transpose('time', 'y', 'x').data
+
+    ny, nx = ds.sizes['y'], ds.sizes['x']
+    n_rows, n_cols = -(-ny // tile_size), -(-nx // tile_size)
+    if levels is None:
+        levels = int(np.ceil(np.log2(max(n_rows, n_cols, 1)))) + 1
+
+    root = zarr.open_group(store, mode='w')
+    root.attrs.update({'tile_size': tile_size, 'levels': levels, 'shape': [ny, nx],
+                       'group_names': list(GROUP_NAMES)})
+
+    def create(level, rows, cols):
+        group = root.create_group(str(level))
+        shape = (rows, cols, N_GROUPS, N_GROUPS)
+        chunks = (TILE_CHUNKS, TILE_CHUNKS, N_GROUPS, N_GROUPS)
+        return (group.zeros('sums', shape=shape, chunks=chunks, dtype='f8'),
+                group.zeros('counts', shape=shape, chunks=chunks, dtype='i8'))
+
+    sums, counts = create(0, n_rows, n_cols)
+    for row in range(n_rows):
+        rows = slice(row * tile_size, (row + 1) * tile_size)
+        tiles = [dask.delayed(block_matrix)(stocks[:, rows, col * tile_size:(col + 1) * tile_size],
+                                            land_cover[:, rows, col * tile_size:(col + 1) * tile_size])
+                 for col in range(n_cols)]
+        tiles = dask.compute(*tiles)
+        sums[row] = np.stack([tile[0] for tile in tiles])
+        counts[row] = np.stack([tile[1] for tile in tiles])
+        log.info(f"🧱  pyramid tile row {row + 1}/{n_rows} done")
+
+    for level in range(1, levels):
+        n_rows, n_cols = -(-n_rows // 2), -(-n_cols // 2)
+        previous_sums, previous_counts = sums, counts
+        sums, counts = create(level, n_rows, n_cols)
+        for row in range(n_rows):
+            sums[row] = _coarsen(previous_sums[2 * row:2 * row + 2])[0]
+            counts[row] = _coarsen(previous_counts[2 * row:2 * row + 2])[0]
+
+    return TransitionPyramid(store)
+
+
+class TransitionPyramid:
+    """
+    Read side of a pyramid written by `build_pyramid`.
+
+    A bbox query sums the pyramid tiles that lie inside the bbox, using the coarsest
+    level available for each part of it, and only reads raw pixels along the edges.
+    """
+
+    def __init__(self, store):
+        self.root = zarr.open_group(store, mode='r')
+        self.tile_size = self.root.attrs['tile_size']
+        self.levels = self.root.attrs['levels']
+        self.shape = tuple(self.root.attrs['shape'])
+
+        if tuple(self.root.attrs['group_names']) != GROUP_NAMES:
+            raise ValueError("Pyramid was built with different land cover groups.")
+
+    def _read(self, level, rows, cols):
+        group = self.root[str(level)]
+        return (group['sums'][rows, cols].sum(axis=(0, 1)),
+                group['counts'][rows, cols].sum(axis=(0, 1)))
+
+    def sum_tiles(self, r0, r1, c0, c1, level=None):
+        """
+        Sum level 0 tiles [r0, r1) x [c0, c1), covering as much as possible with coarser tiles.
+        """
+        if level is None:
+            level = self.levels - 1
+
+        sums, counts = empty_matrix()
+        if r0 >= r1 or c0 >= c1:
+            return sums, counts
+
+        factor = 2 ** level
+        rows = slice(-(-r0 // factor), r1 // factor)
+        cols = slice(-(-c0 // factor), c1 // factor)
+        if level == 0:
+            return self._read(0, rows, cols)
+        if rows.start >= rows.stop or cols.start >= cols.stop:
+            return self.sum_tiles(r0, r1, c0, c1, level=level - 1)
+
+        sums, counts = self._read(level, rows, cols)
+
+        # Frame around the coarse block, resolved with finer levels
+        inner_r0, inner_r1 = rows.start * factor, rows.stop * factor
+        inner_c0, inner_c1 = cols.start * factor, cols.stop * factor
+        for part in [(r0, inner_r0, c0, c1), (inner_r1, r1, c0, c1),
+                     (inner_r0, inner_r1, c0, inner_c0), (inner_r0, inner_r1, inner_c1, c1)]:
+            part_sums, part_counts = self.sum_tiles(*part, level=level - 1)
+            sums += part_sums
+            counts += part_counts
+
+        return sums, counts
+
+    def query(self, ds, bbox):
+        """
+        Transition matrix of a bbox.
+
+        Parameters:
+        ds (xr.Dataset): The dataset the pyramid was built from, used for the bbox edges.
+        bbox (tuple): (xmin, ymin, xmax, ymax).
+
+        Returns:
+        (sums, counts) as returned by `transitions.transition_matrix`.
+        """
+        if (ds.sizes['y'], ds.sizes['x']) != self.shape:
+            raise ValueError("Dataset does not match the pyramid grid.")
+
+        y, x = bbox_indexer(ds, bbox)
+        tile_size = self.tile_size
+        r0, r1 = -(-y.start // tile_size), y.stop // tile_size
+        c0, c1 = -(-x.start // tile_size), x.stop // tile_size
+
+        if r0 >= r1 or c0 >= c1:
+            return reduce_chunks(ds.isel(y=y, x=x))
+
+        sums, counts = self.sum_tiles(r0, r1, c0, c1)
+
+        # Raw pixels along the bbox edges
+        rows = slice(r0 * tile_size, r1 * tile_size)
+        for edge_y, edge_x in [(slice(y.start, rows.start), x), (slice(rows.stop, y.stop), x),
+                               (rows, slice(x.start, c0 * tile_size)), (rows, slice(c1 * tile_size, x.stop))]:
+            if edge_y.start < edge_y.stop and edge_x.start < edge_x.stop:
+                edge_sums, edge_counts = reduce_chunks(ds.isel(y=edge_y, x=edge_x))
+                sums += edge_sums
+                counts += edge_counts
+
+        return sums, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the transition matrix pyramid from the S3 zarr stores.")
+    parser.add_argument('output', help="Path of the zarr store to write.")
+    parser.add_argument('--tile-size', type=int, default=None, help="Tile size in pixels.")
+    parser.add_argument('--levels', type=int, default=None, help="Number of pyramid levels.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ds = read_ds(access_key_id=os.environ['S3_ACCESS_KEY_ID'],
+                 secret_accsess_key=os.environ['S3_SECRET_ACCESS_KEY'])
+    build_pyramid(ds, store=args.output, tile_size=args.tile_size, levels=args.levels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import pickle
+import threading
+import time
+
+from cachetools import TTLCache
+
+from soils_revealed.chunk_cache import DiskLRU
+from soils_revealed.data_params import bbox_indexer
+
+
+def grid_key(ds, bbox):
+    """
+    Cache key of a bbox: the (y, x) pixel window it selects in `ds`.
+
+    Rectangles that differ by less than a pixel share a key.
+    """
+    y, x = bbox_indexer(ds, bbox)
+    return y.start, y.stop, x.start, x.stop
+
+
+class ResultCache:
+    """
+    Thread-safe cache of Submit results (transition dict and rendered figure bytes).
+
+    Entries expire after `ttl` seconds and the least recently used ones are evicted
+    beyond `maxsize` entries. With `disk_path` entries are also written to a
+    size-bounded directory, so they survive restarts.
+    """
+
+    def __init__(self, maxsize=512, ttl=24 * 3600, disk_path=None, disk_bytes=256 * 2 ** 20):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._disk = DiskLRU(disk_path, disk_bytes) if disk_path else None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is None and self._disk:
+                stored = self._disk.get(repr(key))
+                if stored is not None:
+                    created, stored_value = pickle.loads(stored)
+                    if time.time() - created < self.ttl:
+                        value = stored_value
+                        self._memory[key] = value
+                    else:
+                        self._disk.discard(repr(key))
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            if self._disk:
+                self._disk.put(repr(key), pickle.dumps((time.time(), value)))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._memory)}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache(**kwargs):
+    """
+    Return the process-wide `ResultCache`, shared by all Streamlit sessions.
+
+    `kwargs` only apply when the cache is first created.
+    """
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(**kwargs)
+
+        return _result_cache
@@ -0,0 +1,232 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import dask
+import numpy as np
+
+from soils_revealed.area import KM2_TO_HA, row_cell_areas
+from soils_revealed.data_params import bbox_indexer
+from soils_revealed.masks import get_mask, is_rectangle
+from soils_revealed.transitions import empty_matrix, transition_matrix
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Region:
+    """
+    Pixel window of a region and, for polygons, the boolean mask of its pixels inside the window.
+    """
+    id: str
+    y: slice
+    x: slice
+    mask: np.ndarray = None
+
+
+@dataclass
+class PlanMetrics:
+    """
+    Number of regions of a run and of the (y, x) zarr chunks of `stocks` and `land-cover` it read,
+    against the chunks evaluating every region on its own would read.
+    """
+    regions: int = 0
+    chunks_read: int = 0
+    naive_chunk_reads: int = 0
+    seconds: float = 0.
+
+    @property
+    def chunks_saved(self) -> int:
+        return self.naive_chunk_reads - self.chunks_read
+
+    @property
+    def savings(self) -> float:
+        """
+        Fraction of the chunk reads of evaluating every region on its own that were avoided.
+        """
+        return self.chunks_saved / self.naive_chunk_reads if self.naive_chunk_reads else 0.
+
+
+@dataclass
+class ChunkPlan:
+    """
+    Regions mapped onto the chunk grid of a dataset.
+
+    Parameters:
+    regions (list): `Region`s to evaluate.
+    row_bounds, column_bounds (np.ndarray): Pixel offsets of the chunk boundaries, starting at 0.
+    variable_bounds (dict): Variable name -> (row bounds, column bounds) of its own zarr chunks.
+    chunk_regions (dict): (chunk row, chunk column) -> indices of the regions intersecting the chunk.
+    """
+    regions: List[Region]
+    row_bounds: np.ndarray
+    column_bounds: np.ndarray
+    variable_bounds: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    chunk_regions: Dict[Tuple[int, int], List[int]] = field(default_factory=dict)
+
+    def chunk_window(self, chunk):
+        row, column = chunk
+        return slice(self.row_bounds[row], self.row_bounds[row + 1]), \
+            slice(self.column_bounds[column], self.column_bounds[column + 1])
+
+
+def _chunk_range(bounds, window):
+    # Chunks overlapping the [start, stop) pixel window
+    if window.stop <= window.start:
+        return range(0)
+    return range(np.searchsorted(bounds, window.start, side='right') - 1,
+                 np.searchsorted(bounds, window.stop, side='left'))
+
+
+def _variable_bounds(ds, name, dim):
+    return np.cumsum((0,) + tuple(ds[name].chunksizes.get(dim, (ds.sizes[dim],))))
+
+
+def chunk_bounds(ds, dim):
+    """
+    Pixel offsets of the plan chunk boundaries along `dim`.
+
+    When the chunks of one of `stocks` and `land-cover` nest in those of the other (as in the S3
+    stores), plan chunks are the larger ones and every chunk of both variables lies within a single
+    plan chunk. Otherwise they are the `stocks` chunks, never the whole dimension.
+    """
+    stocks, land_cover = _variable_bounds(ds, 'stocks', dim), _variable_bounds(ds, 'land-cover', dim)
+    shared = np.intersect1d(stocks, land_cover)
+
+    return shared if shared.size in (stocks.size, land_cover.size) else stocks
+
+
+def plan(ds, features):
+    """
+    Map regions onto the chunk grid of `ds` and index the regions intersecting every chunk.
+
+    Polygons are rasterized (see `masks.get_mask`), chunks of their window that hold
+    none of their pixels are left out.
+
+    Parameters:
+    ds (xr.Dataset): Dataset as returned by `read_ds`.
+    features (list): (id, shapely geometry) pairs.
+    """
+    row_bounds, column_bounds = chunk_bounds(ds, 'y'), chunk_bounds(ds, 'x')
+    chunk_plan = ChunkPlan(regions=[], row_bounds=row_bounds, column_bounds=column_bounds,
+                           variable_bounds={name: (_variable_bounds(ds, name, 'y'), _variable_bounds(ds, name, 'x'))
+                                            for name in ('stocks', 'land-cover')})
+
+    for feature_id, geometry in features:
+        if is_rectangle(geometry):
+            region = Region(feature_id, *bbox_indexer(ds, geometry.bounds))
+        else:
+            region = Region(feature_id, *get_mask(ds, geometry))
+
+        index = len(chunk_plan.regions)
+        chunk_plan.regions.append(region)
+        for row in _chunk_range(row_bounds, region.y):
+            for column in _chunk_range(column_bounds, region.x):
+                if region.mask is not None and not _region_window(chunk_plan, region, (row, column))[2].any():
+                    continue
+                chunk_plan.chunk_regions.setdefault((row, column), []).append(index)
+
+    return chunk_plan
+
+
+def _region_window(chunk_plan, region, chunk):
+    """
+    Intersection of a region with a chunk: slices into the chunk and the mask of the region there.
+    """
+    chunk_y, chunk_x = chunk_plan.chunk_window(chunk)
+    y = slice(max(chunk_y.start, region.y.start), min(chunk_y.stop, region.y.stop))
+    x = slice(max(chunk_x.start, region.x.start), min(chunk_x.stop, region.x.stop))
+
+    mask = None
+    if region.mask is not None:
+        mask = region.mask[y.start - region.y.start:y.stop - region.y.start,
+                           x.start - region.x.start:x.stop - region.x.start]
+
+    return slice(y.start - chunk_y.start, y.stop - chunk_y.start), \
+        slice(x.start - chunk_x.start, x.stop - chunk_x.start), mask
+
+
+def _load_window(chunk_plan, chunk):
+    """
+    Part of a chunk covered by its regions, and the windows of the regions relative to that part.
+    """
+    chunk_y, chunk_x = chunk_plan.chunk_window(chunk)
+    windows = [_region_window(chunk_plan, chunk_plan.regions[index], chunk)
+               for index in chunk_plan.chunk_regions[chunk]]
+    y0, y1 = min(y.start for y, _, _ in windows), max(y.stop for y, _, _ in windows)
+    x0, x1 = min(x.start for _, x, _ in windows), max(x.stop for _, x, _ in windows)
+
+    return slice(chunk_y.start + y0, chunk_y.start + y1), slice(chunk_x.start + x0, chunk_x.start + x1), \
+        [(slice(y.start - y0, y.stop - y0), slice(x.start - x0, x.stop - x0), mask) for y, x, mask in windows]
+
+
+def _chunks_touched(chunk_plan, y, x, mask=None):
+    """
+    (variable, chunk row, chunk column) of the zarr chunks overlapping the [y, x] pixel window, only
+    those holding pixels of `mask` (of the shape of the window) when given.
+    """
+    touched = set()
+    for name, (rows, columns) in chunk_plan.variable_bounds.items():
+        for row in _chunk_range(rows, y):
+            for column in _chunk_range(columns, x):
+                if mask is not None and not mask[max(rows[row] - y.start, 0):rows[row + 1] - y.start,
+                                                 max(columns[column] - x.start, 0):columns[column + 1] - x.start].any():
+                    continue
+                touched.add((name, row, column))
+
+    return touched
+
+
+def _reduce_window(stocks, land_cover, windows, row_weights):
+    # (time, y, x) blocks of the part of a chunk its regions cover, shared by all of them
+    return [transition_matrix(stocks_2000=stocks[0, y, x], stocks_2018=stocks[1, y, x],
+                              lc_2000=land_cover[0, y, x], lc_2018=land_cover[1, y, x],
+                              weights=None if row_weights is None else row_weights[y, None], mask=mask)
+            for y, x, mask in windows]
+
+
+def execute(ds, chunk_plan, area_weighted=False, max_workers=None):
+    """
+    Read every chunk of a plan once, where its regions lie, and add its contribution to all of them.
+
+    The windows of all the chunks are cut from the variables in a single dask graph, so a zarr chunk
+    overlapping several of them, e.g. a land cover chunk straddling two stocks chunks, is fetched once.
+
+    Parameters:
+    ds (xr.Dataset): Dataset the plan was made for.
+    chunk_plan (ChunkPlan): Plan returned by `plan`.
+    area_weighted (bool): Weight every pixel by its area, summing t C instead of t C/ha.
+    max_workers (int): Number of threads reading and reducing chunks.
+
+    Returns:
+    (results, metrics): region id -> (sums, counts) transition matrix, and the `PlanMetrics` of the run.
+    """
+    start = time.perf_counter()
+    row_weights = row_cell_areas(ds) * KM2_TO_HA if area_weighted else None
+    stocks = ds['stocks'].transpose('time', 'y', 'x').data
+    land_cover = ds['land-cover'].transpose('time', 'y', 'x').data
+
+    chunks = sorted(chunk_plan.chunk_regions)
+    partials, touched = [], set()
+    for chunk in chunks:
+        load_y, load_x, windows = _load_window(chunk_plan, chunk)
+        touched |= _chunks_touched(chunk_plan, load_y, load_x)
+        partials.append(dask.delayed(_reduce_window)(stocks[:, load_y, load_x], land_cover[:, load_y, load_x],
+                                                     windows, None if row_weights is None else row_weights[load_y]))
+
+    matrices = [empty_matrix() for _ in chunk_plan.regions]
+    for chunk, chunk_partials in zip(chunks, dask.compute(*partials, num_workers=max_workers)):
+        for index, (partial_sums, partial_counts) in zip(chunk_plan.chunk_regions[chunk], chunk_partials):
+            sums, counts = matrices[index]
+            sums += partial_sums
+            counts += partial_counts
+
+    naive_chunk_reads = sum(len(_chunks_touched(chunk_plan, region.y, region.x, region.mask))
+                            for region in chunk_plan.regions)
+    metrics = PlanMetrics(regions=len(chunk_plan.regions), chunks_read=len(touched),
+                          naive_chunk_reads=naive_chunk_reads, seconds=time.perf_counter() - start)
+    log.info(f"🧩  {metrics.regions} regions from {metrics.chunks_read} chunks "
+             f"instead of {metrics.naive_chunk_reads} ({metrics.savings:.0%} saved)")
+
+    return {region.id: matrix for region, matrix in zip(chunk_plan.regions, matrices)}, metrics
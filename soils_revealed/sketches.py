@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from soils_revealed.transitions import GROUP_NAMES, N_GROUPS, group_index, matrix_to_data
+
+# Log-bucketed quantile histogram (as in DDSketch): any quantile within 1 % of the value it
+# stands for. Changes smaller than MIN_VALUE share the zero bucket, larger than MAX_VALUE the last one.
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-3
+MAX_VALUE = 1e6
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_K_MIN = int(np.ceil(np.log(MIN_VALUE) / np.log(_GAMMA)))
+_K_MAX = int(np.ceil(np.log(MAX_VALUE) / np.log(_GAMMA)))
+_N_MAGNITUDES = _K_MAX - _K_MIN + 1
+# Negative buckets by descending magnitude, the zero bucket, positive buckets by ascending magnitude
+N_BUCKETS = 2 * _N_MAGNITUDES + 1
+_BUCKET_MAGNITUDES = 2 * _GAMMA ** np.arange(_K_MIN, _K_MAX + 1) / (_GAMMA + 1)
+BUCKET_VALUES = np.concatenate([-_BUCKET_MAGNITUDES[::-1], [0.], _BUCKET_MAGNITUDES])
+
+N_BINS = N_GROUPS * N_GROUPS
+
+
+def bucket_index(values):
+    """
+    Histogram bucket of every value, see `BUCKET_VALUES`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    k = np.clip(np.ceil(np.log(np.maximum(magnitude, MIN_VALUE)) / np.log(_GAMMA)), _K_MIN, _K_MAX).astype(np.intp)
+
+    return np.where(magnitude < MIN_VALUE, _N_MAGNITUDES,
+                    np.where(values > 0, _N_MAGNITUDES + 1 + k - _K_MIN, _K_MAX - k))
+
+
+@dataclass
+class TransitionSketch:
+    """
+    Mergeable per-transition statistics of the pixel stock changes.
+
+    `sums` and `counts` are the transition matrix of `transitions.transition_matrix`. The
+    other fields only cover the non-NaN changes: their number `n`, `mean` and sum of squared
+    deviations `m2` (Welford), and a (N_BINS, N_BUCKETS) quantile histogram.
+    """
+    sums: np.ndarray
+    counts: np.ndarray
+    n: np.ndarray
+    mean: np.ndarray
+    m2: np.ndarray
+    histogram: np.ndarray
+
+    @classmethod
+    def empty(cls):
+        return cls(sums=np.zeros((N_GROUPS, N_GROUPS)), counts=np.zeros((N_GROUPS, N_GROUPS), dtype=np.int64),
+                   n=np.zeros((N_GROUPS, N_GROUPS), dtype=np.int64), mean=np.zeros((N_GROUPS, N_GROUPS)),
+                   m2=np.zeros((N_GROUPS, N_GROUPS)), histogram=np.zeros((N_BINS, N_BUCKETS), dtype=np.int64))
+
+    def merge(self, other):
+        """
+        Statistics of the union of both pixel sets (Chan et al. parallel update of the moments).
+        """
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        fraction = np.divide(other.n, n, out=np.zeros(n.shape), where=n > 0)
+
+        return TransitionSketch(sums=self.sums + other.sums, counts=self.counts + other.counts, n=n,
+                                mean=self.mean + delta * fraction,
+                                m2=self.m2 + other.m2 + delta ** 2 * self.n * fraction,
+                                histogram=self.histogram + other.histogram)
+
+    def variance(self, ddof=1):
+        return np.divide(self.m2, self.n - ddof, out=np.full(self.m2.shape, np.nan), where=self.n > ddof)
+
+    def quantile(self, q):
+        """
+        Approximate `q` quantile of every transition, NaN where there is no pixel.
+        """
+        cumulative = np.cumsum(self.histogram, axis=1)
+        total = cumulative[:, -1]
+        bucket = np.argmax(cumulative >= np.maximum(q * total, 1)[:, None], axis=1)
+
+        return np.where(total > 0, BUCKET_VALUES[bucket], np.nan).reshape(N_GROUPS, N_GROUPS)
+
+    def data(self):
+        """
+        The {lc_2018: {lc_2000: sum}} dict of `transitions.matrix_to_data`.
+        """
+        return matrix_to_data(self.sums, self.counts)
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        {lc_2018: {lc_2000: {count, mean, std, q05, ...}}} of the transitions in `data`.
+        """
+        std = np.sqrt(self.variance())
+        values = {f'q{round(q * 100):02d}': self.quantile(q) for q in quantiles}
+        index = {name: i for i, name in enumerate(GROUP_NAMES)}
+
+        return {lc_2018: {lc_2000: {'count': int(self.n[index[lc_2000], index[lc_2018]]),
+                                    'mean': float(self.mean[index[lc_2000], index[lc_2018]]),
+                                    'std': float(std[index[lc_2000], index[lc_2018]]),
+                                    **{key: float(value[index[lc_2000], index[lc_2018]])
+                                       for key, value in values.items()}}
+                          for lc_2000 in row}
+                for lc_2018, row in self.data().items()}
+
+    def total_errors(self):
+        """
+        Standard error of the summed change of every lc_2018 category, sqrt(sum of n * variance)
+        over its transitions, for the error bars of `processing.get_plot`.
+        """
+        variance = np.nan_to_num(self.variance(ddof=1))
+        errors = np.sqrt((self.n * variance).sum(axis=0))
+
+        return {lc_2018: float(errors[GROUP_NAMES.index(lc_2018)]) for lc_2018 in self.data()}
+
+
+def transition_sketch(stocks_2000, stocks_2018, lc_2000, lc_2018, weights=None, mask=None):
+    """
+    `TransitionSketch` of a set of pixels, selected as in `transitions.transition_matrix`.
+    """
+    lc_2000 = np.asarray(lc_2000).ravel()
+    lc_2018 = np.asarray(lc_2018).ravel()
+    change = np.subtract(stocks_2018, stocks_2000, dtype=np.float64)
+    if weights is not None:
+        change *= weights
+    change = change.ravel()
+
+    keep = (lc_2000 != lc_2018) & (change != 0.)
+    if mask is not None:
+        keep &= np.asarray(mask).ravel()
+    index = group_index(lc_2000[keep]) * N_GROUPS + group_index(lc_2018[keep])
+    change = change[keep]
+
+    valid = ~np.isnan(change)
+    counts = np.bincount(index, minlength=N_BINS)
+    index, change = index[valid], change[valid]
+
+    n = np.bincount(index, minlength=N_BINS)
+    sums = np.bincount(index, weights=change, minlength=N_BINS)
+    mean = np.divide(sums, n, out=np.zeros(N_BINS), where=n > 0)
+    # Two passes over the block: squared deviations from its own mean, merged with `merge`
+    m2 = np.bincount(index, weights=(change - mean[index]) ** 2, minlength=N_BINS)
+    histogram = np.bincount(index * N_BUCKETS + bucket_index(change), minlength=N_BINS * N_BUCKETS)
+
+    return TransitionSketch(sums=sums.reshape(N_GROUPS, N_GROUPS), counts=counts.reshape(N_GROUPS, N_GROUPS),
+                            n=n.reshape(N_GROUPS, N_GROUPS), mean=mean.reshape(N_GROUPS, N_GROUPS),
+                            m2=m2.reshape(N_GROUPS, N_GROUPS), histogram=histogram.reshape(N_BINS, N_BUCKETS))
+
+
+def block_sketch(stocks, land_cover, row_weights=None, mask=None):
+    """
+    `transition_sketch` of a (time, y, x) block, see `transitions.block_matrix`.
+    """
+    return transition_sketch(stocks_2000=stocks[0], stocks_2018=stocks[1],
+                             lc_2000=land_cover[0], lc_2018=land_cover[1],
+                             weights=None if row_weights is None else np.asarray(row_weights)[:, None],
+                             mask=mask)
+
+
+def merge_sketches(*sketches):
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = merged.merge(sketch)
+
+    return merged
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+import ee
+
+FINISHED_STATES = {'COMPLETED', 'FAILED', 'CANCELLED', 'CANCEL_REQUESTED'}
+FAILED_STATES = {'FAILED', 'CANCELLED', 'CANCEL_REQUESTED'}
+
+
+class EETaskBackend:
+    """
+    Earth Engine task backend.
+
+    Any object with the same `start`, `statuses` and `cancel` methods can replace it,
+    e.g. a fake backend in tests.
+    """
+
+    def start(self, task):
+        task.start()
+
+    def statuses(self, tasks: list) -> list:
+        # A single request for all tasks
+        return ee.data.getTaskStatus([task.id for task in tasks])
+
+    def cancel(self, task):
+        task.cancel()
+
+
+@dataclass
+class ExportProgress:
+    states: Dict[str, str]
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def completed(self) -> int:
+        return sum(state == 'COMPLETED' for state in self.states.values())
+
+    @property
+    def total(self) -> int:
+        return len(self.states)
+
+    @property
+    def fraction(self) -> float:
+        return self.completed / self.total if self.total else 1.
+
+    @property
+    def failed(self) -> bool:
+        return any(state in FAILED_STATES for state in self.states.values())
+
+    @property
+    def finished(self) -> bool:
+        return all(state in FINISHED_STATES for state in self.states.values())
+
+
+class ExportTaskMonitor:
+    """
+    Start and track many export tasks.
+
+    At most `max_running` tasks run at once, the others wait in the queue. All running
+    tasks are polled with one batched status request, the delay between polls grows
+    exponentially while nothing changes and resets when a task changes state. When a
+    task fails every other task is cancelled.
+
+    Parameters:
+    tasks (dict): Task name -> unstarted task.
+    backend: Task backend, defaults to `EETaskBackend`.
+    max_running (int): Maximum number of tasks running at the same time.
+    initial_delay, max_delay (float): Bounds of the delay between polls, in seconds.
+    backoff (float): Delay growth factor while no task changes state.
+    """
+
+    def __init__(self, tasks: dict, backend=None, max_running: int = 4, initial_delay: float = 5.,
+                 max_delay: float = 60., backoff: float = 2.):
+        self.tasks = tasks
+        self.backend = backend or EETaskBackend()
+        self.max_running = max_running
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.delay = initial_delay
+        self.progress = ExportProgress(states={name: 'QUEUED' for name in tasks})
+
+    def _active(self):
+        return [name for name, state in self.progress.states.items() if state not in FINISHED_STATES | {'QUEUED'}]
+
+    def _cancel_all(self):
+        for name in self._active():
+            self.backend.cancel(self.tasks[name])
+        for name, state in self.progress.states.items():
+            if state not in FINISHED_STATES:
+                self.progress.states[name] = 'CANCELLED'
+
+    def poll(self) -> ExportProgress:
+        """
+        Start queued tasks up to the limit and refresh the state of the active ones.
+        """
+        states = self.progress.states
+        previous = dict(states)
+
+        for name in [name for name, state in states.items() if state == 'QUEUED']:
+            if len(self._active()) >= self.max_running:
+                break
+            self.backend.start(self.tasks[name])
+            states[name] = 'READY'
+
+        active = self._active()
+        if active:
+            for name, status in zip(active, self.backend.statuses([self.tasks[name] for name in active])):
+                states[name] = status.get('state')
+                if status.get('error_message'):
+                    self.progress.errors[name] = status.get('error_message')
+
+        if self.progress.failed:
+            self._cancel_all()
+
+        if states == previous:
+            self.delay = min(self.delay * self.backoff, self.max_delay)
+        else:
+            self.delay = self.initial_delay
+
+        return self.progress
+
+    def run(self, progress_callback: Optional[Callable[[ExportProgress], None]] = None,
+            sleep: Callable[[float], None] = time.sleep) -> ExportProgress:
+        """
+        Poll until every task has finished, calling `progress_callback` after each poll.
+        """
+        while True:
+            progress = self.poll()
+            if progress_callback:
+                progress_callback(progress)
+            if progress.finished:
+                return progress
+            sleep(self.delay)
+
+    async def run_async(self, progress_callback: Optional[Callable[[ExportProgress], None]] = None) -> ExportProgress:
+        """
+        Same as `run`, polling in a worker thread and waiting with `asyncio.sleep`.
+        """
+        while True:
+            progress = await asyncio.to_thread(self.poll)
+            if progress_callback:
+                progress_callback(progress)
+            if progress.finished:
+                return progress
+            await asyncio.sleep(self.delay)
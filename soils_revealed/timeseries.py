@@ -0,0 +1,215 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from soils_revealed.area import KM2_TO_HA, row_cell_areas
+from soils_revealed.chunk_cache import DiskLRU
+from soils_revealed.data_params import bbox_indexer
+from soils_revealed.transitions import GROUP_NAMES, N_GROUPS, group_index
+
+
+def transition_index(lc_2000, lc_2018, changed_only=True):
+    """
+    Flat transition index (lc_2000 group * N_GROUPS + lc_2018 group) of every pixel, -1 for pixels left out.
+
+    Parameters:
+    lc_2000, lc_2018 (np.ndarray): Land cover codes of both years.
+    changed_only (bool): Leave out the pixels whose land cover code did not change, as the transition plots do.
+    """
+    lc_2000 = np.asarray(lc_2000).ravel()
+    lc_2018 = np.asarray(lc_2018).ravel()
+
+    keep = lc_2000 != lc_2018 if changed_only else np.ones(lc_2000.shape, dtype=bool)
+    index = np.full(lc_2000.shape, -1, dtype=np.intp)
+    index[keep] = group_index(lc_2000[keep]) * N_GROUPS + group_index(lc_2018[keep])
+
+    return index
+
+
+def yearly_sums(stocks, index, weights=None):
+    """
+    Sum the stocks of every year per land cover transition.
+
+    Parameters:
+    stocks (np.ndarray): (time, y, x) stocks.
+    index (np.ndarray): Transition index of the (y, x) pixels, see `transition_index`.
+    weights (np.ndarray): Optional per-pixel weights broadcast against (y, x).
+
+    Returns:
+    (sums, counts): float64 and int64 arrays of shape (time, N_GROUPS, N_GROUPS), counts holding
+        the number of non-NaN pixels summed.
+    """
+    stocks = np.asarray(stocks)
+    n_times, n_bins = stocks.shape[0], N_GROUPS * N_GROUPS
+
+    keep = index >= 0
+    values = stocks.reshape(n_times, -1)[:, keep].astype(np.float64)
+    if weights is not None:
+        values *= np.broadcast_to(weights, stocks.shape[1:]).ravel()[keep]
+
+    # One bincount for all years, year t filling bins [t * n_bins, (t + 1) * n_bins)
+    bins = np.arange(n_times)[:, None] * n_bins + index[keep]
+    valid = ~np.isnan(values)
+    sums = np.bincount(bins[valid], weights=values[valid], minlength=n_times * n_bins)
+    counts = np.bincount(bins[valid], minlength=n_times * n_bins)
+
+    return sums.reshape(n_times, N_GROUPS, N_GROUPS), counts.reshape(n_times, N_GROUPS, N_GROUPS).astype(np.int64)
+
+
+class TilePartialCache:
+    """
+    Thread-safe cache of the (sums, counts) partial of every (tile, year).
+
+    Partials are kept per year, so extending a time series to a new year only computes the new
+    slice of every tile. With `path` they are also written to a size-bounded directory.
+
+    Parameters:
+    path (str): Directory of the on-disk partials. Memory only if None.
+    max_bytes (int): Byte budget of the on-disk partials.
+    namespace (str): Prefix of the keys, to share a directory between datasets.
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 2 ** 20, namespace='', maxsize=65536):
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._memory = LRUCache(maxsize=maxsize)
+        self._disk = DiskLRU(path, max_bytes) if path else None
+        self._lock = threading.Lock()
+
+    def _key(self, tile, time, options):
+        return f'{self.namespace}/{tile[0]}-{tile[1]}/{np.datetime_as_string(time)}/{options}'
+
+    def get(self, tile, time, options=''):
+        key = self._key(tile, time, options)
+        with self._lock:
+            partial = self._memory.get(key)
+            if partial is None and self._disk:
+                stored = self._disk.get(key)
+                if stored is not None:
+                    values = np.frombuffer(stored, dtype=np.float64)
+                    partial = (values[:N_GROUPS * N_GROUPS].reshape(N_GROUPS, N_GROUPS),
+                               values[N_GROUPS * N_GROUPS:].view(np.int64).reshape(N_GROUPS, N_GROUPS))
+                    self._memory[key] = partial
+
+            if partial is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            return partial
+
+    def put(self, tile, time, partial, options=''):
+        key = self._key(tile, time, options)
+        sums, counts = partial
+        with self._lock:
+            self._memory[key] = partial
+            if self._disk:
+                self._disk.put(key, sums.astype(np.float64).tobytes() + counts.astype(np.int64).tobytes())
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._memory)}
+
+
+def _tiles(ds, y, x):
+    # Intersections of the (y, x) window with the chunks of the stocks, and whether they cover the whole chunk
+    chunks = ds['stocks'].chunksizes
+    row_bounds = np.cumsum((0,) + tuple(chunks.get('y', (ds.sizes['y'],))))
+    column_bounds = np.cumsum((0,) + tuple(chunks.get('x', (ds.sizes['x'],))))
+
+    for row in range(len(row_bounds) - 1):
+        tile_y = slice(max(row_bounds[row], y.start), min(row_bounds[row + 1], y.stop))
+        if tile_y.start >= tile_y.stop:
+            continue
+        for column in range(len(column_bounds) - 1):
+            tile_x = slice(max(column_bounds[column], x.start), min(column_bounds[column + 1], x.stop))
+            if tile_x.start >= tile_x.stop:
+                continue
+            full = (tile_y.start, tile_y.stop, tile_x.start, tile_x.stop) == \
+                (row_bounds[row], row_bounds[row + 1], column_bounds[column], column_bounds[column + 1])
+            yield (row, column), tile_y, tile_x, full
+
+
+def trajectories(ds, bbox, cache=None, area_weighted=False, changed_only=True, max_workers=None):
+    """
+    Summed stocks of every year per land cover transition of a bbox, in one pass over the time axis.
+
+    The transition of every pixel is classified once per tile and reused for all years. Tiles
+    fully inside the bbox are looked up per year in `cache`, only their missing years are read.
+
+    Parameters:
+    ds (xr.Dataset): Dataset as returned by `read_timeseries_ds`, with `stocks` over (time, y, x)
+        and `land-cover` over (lc_time, y, x), lc_time holding 2000 and 2018.
+    bbox (tuple): (xmin, ymin, xmax, ymax).
+    cache (TilePartialCache): Optional cache of the per-tile partials.
+    area_weighted (bool): Weight every pixel by its area, summing t C instead of t C/ha.
+    changed_only (bool): See `transition_index`.
+    max_workers (int): Number of threads reducing tiles.
+
+    Returns:
+    (times, sums, counts): the time coordinate and the (time, N_GROUPS, N_GROUPS) sums and pixel counts.
+    """
+    times = ds['time'].values
+    y, x = bbox_indexer(ds, bbox)
+    row_weights = row_cell_areas(ds) * KM2_TO_HA if area_weighted else None
+    options = f'weighted={area_weighted},changed_only={changed_only}'
+
+    def reduce_tile(tile):
+        position, tile_y, tile_x, full = tile
+        use_cache = cache is not None and full
+
+        cached = {n: cache.get(position, time, options) for n, time in enumerate(times)} if use_cache else {}
+        missing = [n for n in range(len(times)) if cached.get(n) is None]
+
+        sums = np.zeros((len(times), N_GROUPS, N_GROUPS), dtype=np.float64)
+        counts = np.zeros((len(times), N_GROUPS, N_GROUPS), dtype=np.int64)
+        for n, partial in cached.items():
+            if partial is not None:
+                sums[n], counts[n] = partial
+
+        if missing:
+            land_cover = ds['land-cover'].isel(y=tile_y, x=tile_x).transpose('lc_time', 'y', 'x').values
+            index = transition_index(land_cover[0], land_cover[1], changed_only=changed_only)
+            stocks = ds['stocks'].isel(time=missing, y=tile_y, x=tile_x).transpose('time', 'y', 'x').values
+            weights = None if row_weights is None else row_weights[tile_y, None]
+
+            sums[missing], counts[missing] = yearly_sums(stocks, index, weights=weights)
+            if use_cache:
+                for n in missing:
+                    cache.put(position, times[n], (sums[n], counts[n]), options)
+
+        return sums, counts
+
+    total_sums = np.zeros((len(times), N_GROUPS, N_GROUPS), dtype=np.float64)
+    total_counts = np.zeros((len(times), N_GROUPS, N_GROUPS), dtype=np.int64)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for sums, counts in executor.map(reduce_tile, _tiles(ds, y, x)):
+            total_sums += sums
+            total_counts += counts
+
+    return times, total_sums, total_counts
+
+
+def trajectories_to_frame(times, sums, counts):
+    """
+    Long table of the transitions present in any year: time, lc_2000, lc_2018, stocks and pixels.
+    """
+    present = np.argwhere(counts.sum(axis=0) > 0)
+
+    return pd.DataFrame({
+        'time': np.repeat(times, len(present)),
+        'lc_2000': np.tile([GROUP_NAMES[i] for i in present[:, 0]], len(times)),
+        'lc_2018': np.tile([GROUP_NAMES[j] for j in present[:, 1]], len(times)),
+        'stocks': sums[:, present[:, 0], present[:, 1]].ravel(),
+        'pixels': counts[:, present[:, 0], present[:, 1]].ravel(),
+    })
+
+
+def get_trajectories(ds, bbox, **kwargs):
+    """
+    `trajectories` of a bbox as a `trajectories_to_frame` table.
+    """
+    return trajectories_to_frame(*trajectories(ds, bbox, **kwargs))
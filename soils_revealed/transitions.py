@@ -0,0 +1,220 @@
+import dask
+import dask.array as da
+import numpy as np
+
+from soils_revealed.data_params import NO_GROUP, GEEData
+
+dataset = GEEData('Global-Land-Cover')
+metadata = dataset.class_metadata()
+GROUP_LOOKUP = metadata.code_to_group
+GROUP_NAMES = metadata.group_names
+N_GROUPS = len(GROUP_NAMES)
+
+
+def _pair_bins():
+    groups = np.full(256, NO_GROUP, dtype=np.intp)
+    groups[:min(GROUP_LOOKUP.size, 256)] = GROUP_LOOKUP[:256]
+
+    bins = groups[:, None] * N_GROUPS + groups[None, :]
+    bins[(groups[:, None] == NO_GROUP) | (groups[None, :] == NO_GROUP)] = UNMAPPED
+    np.fill_diagonal(bins, -1)
+
+    return bins.astype(np.int16).ravel()
+
+
+# Flat transition bin of every pair of uint8 codes, indexed by lc_2000 << 8 | lc_2018. -1 where
+# the code did not change and UNMAPPED where a code has no group.
+UNMAPPED = N_GROUPS * N_GROUPS
+PAIR_BINS = _pair_bins()
+
+
+def group_index(codes):
+    """
+    Map land cover codes to group indices.
+
+    Parameters:
+    codes (np.ndarray): Integer land cover codes.
+
+    Raises KeyError for codes without a group, like the dict lookup it replaces.
+    """
+    codes = np.asarray(codes)
+    if codes.size == 0:
+        return codes.astype(np.intp)
+
+    if codes.min() < 0 or codes.max() >= GROUP_LOOKUP.size:
+        raise KeyError(str(codes[(codes < 0) | (codes >= GROUP_LOOKUP.size)][0]))
+
+    index = GROUP_LOOKUP[codes]
+    if index.max() == NO_GROUP:
+        raise KeyError(str(codes[index == NO_GROUP][0]))
+
+    return index.astype(np.intp)
+
+
+def empty_matrix():
+    """
+    Return an empty (sums, counts) pair of shape (N_GROUPS, N_GROUPS).
+    """
+    return np.zeros((N_GROUPS, N_GROUPS), dtype=np.float64), np.zeros((N_GROUPS, N_GROUPS), dtype=np.int64)
+
+
+def transition_matrix(stocks_2000, stocks_2018, lc_2000, lc_2018, weights=None, mask=None):
+    """
+    Sum SOC stock change per land cover group transition.
+
+    Only pixels whose land cover code changed and whose stocks changed are counted.
+
+    Parameters:
+    stocks_2000, stocks_2018 (np.ndarray): SOC stocks of both years.
+    lc_2000, lc_2018 (np.ndarray): Land cover codes of both years, same shape as the stocks.
+    weights (np.ndarray): Optional per-pixel weights broadcast against the stocks, e.g. a (y, 1)
+        column of cell areas in ha to sum t C instead of t C/ha.
+    mask (np.ndarray): Optional boolean array of the pixels to count, e.g. a rasterized polygon.
+
+    Returns:
+    (sums, counts): float64 and int64 arrays of shape (N_GROUPS, N_GROUPS) indexed [lc_2000, lc_2018].
+    """
+    lc_2000 = np.asarray(lc_2000).ravel()
+    lc_2018 = np.asarray(lc_2018).ravel()
+    change = np.subtract(stocks_2018, stocks_2000, dtype=np.float64)
+    if weights is not None:
+        change *= weights
+    change = change.ravel()
+
+    if lc_2000.dtype == np.uint8 and lc_2018.dtype == np.uint8:
+        # One table lookup per pixel gives both the changed-code test and the transition bin
+        index = np.take(PAIR_BINS, (lc_2000.astype(np.uint16) << 8) | lc_2018)
+        keep = (index >= 0) & (change != 0.)
+    else:
+        index = None
+        keep = (lc_2000 != lc_2018) & (change != 0.)
+
+    if mask is not None:
+        keep &= np.asarray(mask).ravel()
+
+    if index is not None:
+        index = index[keep]
+    if index is None or (index == UNMAPPED).any():
+        # Raises KeyError for codes without a group
+        index = group_index(lc_2000[keep]) * N_GROUPS + group_index(lc_2018[keep])
+    change = change[keep]
+
+    # NaN changes make the transition show up but do not add to its sum
+    np.nan_to_num(change, copy=False, nan=0.)
+
+    sums = np.bincount(index, weights=change, minlength=N_GROUPS * N_GROUPS)
+    counts = np.bincount(index, minlength=N_GROUPS * N_GROUPS)
+
+    return sums.reshape(N_GROUPS, N_GROUPS), counts.reshape(N_GROUPS, N_GROUPS).astype(np.int64)
+
+
+def matrix_to_data(sums, counts):
+    """
+    Convert a transition matrix into the nested {lc_2018: {lc_2000: sum}} dict used by the plots.
+
+    Both levels are sorted by ascending stock change.
+    """
+    present = counts > 0
+    totals = np.where(present, sums, 0.).sum(axis=0)
+
+    categories = [j for j in range(N_GROUPS) if present[:, j].any()]
+    categories.sort(key=lambda j: (totals[j], GROUP_NAMES[j]))
+
+    data = {}
+    for j in categories:
+        rows = sorted(np.flatnonzero(present[:, j]), key=lambda i: (sums[i, j], GROUP_NAMES[i]))
+        data[GROUP_NAMES[j]] = {GROUP_NAMES[i]: float(sums[i, j]) for i in rows}
+
+    return data
+
+
+def block_matrix(stocks, land_cover, row_weights=None, mask=None):
+    """
+    Transition matrix of a (time, y, x) block of stocks and land cover, optionally weighted per row
+    and restricted to a (y, x) mask.
+    """
+    return transition_matrix(stocks_2000=stocks[0], stocks_2018=stocks[1],
+                             lc_2000=land_cover[0], lc_2018=land_cover[1],
+                             weights=None if row_weights is None else np.asarray(row_weights)[:, None],
+                             mask=mask)
+
+
+def _combine(*partials):
+    # Partials of any shape, e.g. stacked per-depth matrices
+    sums, counts = (np.array(matrix, copy=True) for matrix in partials[0])
+    for partial_sums, partial_counts in partials[1:]:
+        sums += partial_sums
+        counts += partial_counts
+
+    return sums, counts
+
+
+def tree_reduce(partials, split_every=8, combine=_combine, empty=empty_matrix):
+    """
+    Combine delayed (sums, counts) partials with a tree reduction of fan-in `split_every`.
+
+    Other mergeable partials (e.g. `sketches.TransitionSketch`) pass their own `combine`
+    function and `empty` partial factory.
+    """
+    if not partials:
+        return dask.delayed(empty)()
+
+    while len(partials) > 1:
+        partials = [dask.delayed(combine)(*partials[i:i + split_every])
+                    for i in range(0, len(partials), split_every)]
+
+    return partials[0]
+
+
+def reduce_chunks(ds, split_every=8, row_weights=None, mask=None, block_function=block_matrix, combine=_combine,
+                  empty=empty_matrix):
+    """
+    Compute the transition matrix of a lazily opened dataset one chunk at a time.
+
+    Every chunk is reduced to a small (sums, counts) partial and the partials are
+    combined with a tree reduction, so memory does not grow with the selected area.
+
+    Parameters:
+    ds (xr.Dataset): Dataset with `stocks` and `land-cover` variables over (time, y, x), time holding 2000 and 2018.
+    split_every (int): Fan-in of the tree reduction.
+    row_weights (np.ndarray): Optional weight of every row of `ds`, e.g. `area.row_cell_areas` in ha.
+    mask (np.ndarray): Optional boolean (y, x) mask of the pixels to count, see `masks.rasterize`.
+        Chunks without any masked pixel are never read.
+    block_function, combine, empty: Reduction of a block, with the signature of `block_matrix`, and
+        how partials merge, see `tree_reduce`. Default to (sums, counts) transition matrices.
+    """
+    stocks = ds['stocks'].transpose('time', 'y', 'x').data
+    land_cover = ds['land-cover'].transpose('time', 'y', 'x').data
+
+    if not (dask.is_dask_collection(stocks) or dask.is_dask_collection(land_cover)):
+        return block_function(np.asarray(stocks), np.asarray(land_cover), row_weights=row_weights, mask=mask)
+
+    stocks = da.asarray(stocks).rechunk({0: -1})
+    land_cover = da.asarray(land_cover).rechunk({0: -1})
+    _, (stocks, land_cover) = da.core.unify_chunks(stocks, 'tyx', land_cover, 'tyx')
+
+    # Row weights of every block, broadcast over its columns
+    if row_weights is None:
+        block_weights = [None] * len(stocks.chunks[1])
+    else:
+        block_weights = np.split(np.asarray(row_weights), np.cumsum(stocks.chunks[1])[:-1])
+
+    row_bounds = np.cumsum((0,) + stocks.chunks[1])
+    column_bounds = np.cumsum((0,) + stocks.chunks[2])
+
+    partials = []
+    for (_, row, column), stocks_block, land_cover_block in zip(np.ndindex(stocks.numblocks),
+                                                                stocks.to_delayed().ravel(),
+                                                                land_cover.to_delayed().ravel()):
+        block_mask = None
+        if mask is not None:
+            block_mask = mask[row_bounds[row]:row_bounds[row + 1], column_bounds[column]:column_bounds[column + 1]]
+            # Skip chunks outside the mask, they are culled from the graph and never read
+            if not block_mask.any():
+                continue
+            if block_mask.all():
+                block_mask = None
+
+        partials.append(dask.delayed(block_function)(stocks_block, land_cover_block, block_weights[row], block_mask))
+
+    return dask.compute(tree_reduce(partials, split_every=split_every, combine=combine, empty=empty))[0]
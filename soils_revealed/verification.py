@@ -2,6 +2,10 @@ import logging
 from math import sqrt
 from typing import List
 
+from shapely.geometry import shape
+
+from soils_revealed.area import bbox_area_km2, selection_area_km2
+
 log = logging.getLogger(__name__)
 
 
@@ -15,10 +19,22 @@ def _get_area(bbox: List[List[float]]) -> float:
     return round(abs(width * height), 2)
 
 
-def selected_bbox_too_large(geometry: dict, threshold: float) -> bool:
-    bbox = geometry["coordinates"][0]
-    area = _get_area(bbox=bbox)
-    log.info(f"📏  area with size: {area} was selected, threshold is: {threshold}")
+def _get_area_km2(geometry: dict, ds=None) -> float:
+    bounds = shape(geometry).bounds
+    # The pixels the bbox selects, with the cell areas that weight them, when the grid is known
+    area = selection_area_km2(ds, bounds) if ds is not None else bbox_area_km2(*bounds)
+    return round(area, 2)
+
+
+def selected_bbox_too_large(geometry: dict, threshold: float, units: str = 'deg2', ds=None) -> bool:
+    """
+    Check the size of the selected rectangle, in square degrees or, with units='km2', in km².
+
+    In km² any (multi)polygon is accepted and measured by its bounding box: the summed
+    `area.row_cell_areas` of the pixels it selects in `ds`, or its spherical area without `ds`.
+    """
+    area = _get_area_km2(geometry, ds) if units == 'km2' else _get_area(bbox=geometry["coordinates"][0])
+    log.info(f"📏  area with size: {area} {units} was selected, threshold is: {threshold}")
     return area > threshold
 
 
@@ -30,12 +46,9 @@ class CoordinateBoundaries:
 
 
 def selected_bbox_in_boundary(geometry: dict, boundary: CoordinateBoundaries = CoordinateBoundaries) -> bool:
-    bbox = geometry["coordinates"][0]
-    for coordinate in bbox:
-        lon = coordinate[0]
-        lat = coordinate[1]
-        if lon < boundary.lon_min or lon > boundary.lon_max:
-            return False
-        elif lat < boundary.lat_min or lat > boundary.lat_max:
-            return False
+    lon_min, lat_min, lon_max, lat_max = shape(geometry).bounds
+    if lon_min < boundary.lon_min or lon_max > boundary.lon_max:
+        return False
+    elif lat_min < boundary.lat_min or lat_max > boundary.lat_max:
+        return False
     return True
\ No newline at end of file
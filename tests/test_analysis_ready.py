@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from soils_revealed.analysis_ready import build_store
+
+
+def _joined(stocks):
+    coords = {'time': [2000, 2018], 'y': [1.5, 0.5], 'x': [0.5, 1.5, 2.5]}
+    land_cover = np.array([[[10, 30, np.nan], [50, 10, 10]], [[30, 30, 190], [np.nan, 10, 50]]])
+    return xr.Dataset({'stocks': (('time', 'y', 'x'), stocks), 'land-cover': (('time', 'y', 'x'), land_cover)},
+                      coords=coords)
+
+
+def test_scaled_stocks_round_trip(tmp_path):
+    stocks = np.array([[[0., 12.345, np.nan], [327.67, -327.67, 45.6]], [[1.004, 80., 2.5], [3., np.nan, 99.99]]])
+
+    build_store(_joined(stocks), str(tmp_path / 'store.zarr'), chunks=2, stocks_scale=0.01)
+    written = xr.open_zarr(str(tmp_path / 'store.zarr'))
+
+    np.testing.assert_allclose(written['stocks'].values, stocks, atol=0.005)
+    np.testing.assert_array_equal(np.isnan(written['stocks'].values), np.isnan(stocks))
+    np.testing.assert_array_equal(written['land-cover'].values, np.nan_to_num(_joined(stocks)['land-cover'].values))
+
+
+def test_stocks_beyond_int16_are_rejected(tmp_path):
+    stocks = np.full((2, 2, 3), 100.)
+    stocks[1, 0, 0] = 400.
+
+    with pytest.raises(ValueError, match="int16"):
+        build_store(_joined(stocks), str(tmp_path / 'store.zarr'), chunks=2, stocks_scale=0.01)
+
+    build_store(_joined(stocks), str(tmp_path / 'store.zarr'), chunks=2, stocks_scale=0.1)
+    np.testing.assert_allclose(xr.open_zarr(str(tmp_path / 'store.zarr'))['stocks'].values, stocks, atol=0.05)
@@ -0,0 +1,216 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from soils_revealed.backends import (REMOTE_MIN_AREA_KM2, ComputeBackend, EEGroupedReducerBackend,
+                                     LocalZarrBackend, select_backend)
+from soils_revealed.transitions import metadata
+
+CODES = np.array([int(code) for code in metadata.class_group_names])
+
+
+class FakeImage:
+    """
+    Single-band numpy image with a mask, implementing the `ee.Image` methods the backend uses.
+    """
+
+    def __init__(self, values, mask=None, bands=()):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.mask = np.ones(self.values.shape, dtype=bool) if mask is None else mask
+        self.bands = list(bands)
+
+    def _combine(self, other, function):
+        if isinstance(other, FakeImage):
+            return FakeImage(function(self.values, other.values), self.mask & other.mask)
+        return FakeImage(function(self.values, other), self.mask)
+
+    def subtract(self, other):
+        return self._combine(other, np.subtract)
+
+    def add(self, other):
+        return self._combine(other, np.add)
+
+    def multiply(self, other):
+        return self._combine(other, np.multiply)
+
+    def neq(self, other):
+        return self._combine(other, np.not_equal)
+
+    def And(self, other):
+        return self._combine(other, np.logical_and)
+
+    def rename(self, name):
+        return self
+
+    def unmask(self, value):
+        return FakeImage(np.where(self.mask, self.values, value))
+
+    def remap(self, codes, groups, default=None):
+        lookup = dict(zip(codes, groups))
+        values = np.array([lookup.get(int(value), np.nan if default is None else default)
+                           for value in self.values.ravel()]).reshape(self.values.shape)
+        return FakeImage(values, self.mask & ~np.isnan(values))
+
+    def addBands(self, other):
+        return FakeImage(self.values, self.mask & other.mask, bands=[other])
+
+    def updateMask(self, other):
+        mask = self.mask & other.mask & (other.values != 0)
+        return FakeImage(self.values, mask, bands=[FakeImage(band.values, mask) for band in self.bands])
+
+    def reduceRegion(self, reducer, geometry, maxPixels):
+        return FakeResult(self, geometry)
+
+
+class FakeResult:
+    def __init__(self, image, geometry):
+        self.image = image
+        self.geometry = geometry
+
+    def getInfo(self):
+        # Pixels whose center is inside the rectangle, as `ds.sel` selects them
+        xmin, ymin, xmax, ymax = self.geometry
+        y, x = self.geometry.grid
+        inside = ((y >= ymin) & (y <= ymax))[:, None] & ((x >= xmin) & (x <= xmax))[None, :]
+        keep = inside & self.image.mask
+        change, transition = self.image.values[keep], self.image.bands[0].values[keep].astype(int)
+
+        return {'groups': [{'transition': int(index), 'sum': float(change[transition == index].sum()),
+                            'count': int((transition == index).sum())} for index in np.unique(transition)]}
+
+
+class FakeClient:
+    """
+    Stands in for the `ee` module, serving the stocks and land cover of a dataset.
+    """
+
+    def __init__(self, ds, masked_code=0):
+        self.ds = ds
+        self.masked_code = masked_code
+        self.Reducer = FakeReducer()
+        self.Geometry = FakeGeometryFactory(ds['y'].values, ds['x'].values)
+
+    def Image(self, image):
+        return image
+
+    def ImageCollection(self, collection_id):
+        return FakeCollection(self, collection_id)
+
+    def year_image(self, collection_id, year):
+        index = 0 if year == '2000' else 1
+        if 'SOC' in collection_id:
+            return FakeImage(self.ds['stocks'].values[index])
+        land_cover = self.ds['land-cover'].values[index]
+        # No data is masked in Earth Engine and a 0 code in the zarr stores
+        return FakeImage(land_cover, mask=land_cover != self.masked_code)
+
+
+class FakeCollection:
+    def __init__(self, client, collection_id):
+        self.client = client
+        self.collection_id = collection_id
+        self.year = None
+
+    def filterDate(self, start, end):
+        self.year = start[:4]
+        return self
+
+    def first(self):
+        return self.client.year_image(self.collection_id, self.year)
+
+
+class FakeReducer:
+    def sum(self):
+        return self
+
+    def count(self):
+        return self
+
+    def combine(self, other, sharedInputs):
+        return self
+
+    def unweighted(self):
+        return self
+
+    def group(self, groupField, groupName):
+        return self
+
+
+class FakeGeometryFactory:
+    def __init__(self, y, x):
+        self.grid = (y, x)
+
+    def Rectangle(self, coordinates):
+        rectangle = FakeRectangle(coordinates)
+        rectangle.grid = self.grid
+        return rectangle
+
+
+class FakeRectangle(tuple):
+    pass
+
+
+@pytest.fixture
+def ds():
+    rng = np.random.default_rng(0)
+    ny, nx = 40, 50
+    land_cover = rng.choice(CODES[:12], size=(2, ny, nx)).astype(np.uint8)
+    stocks = rng.uniform(20., 80., size=(2, ny, nx)).astype(np.float32)
+    # Unchanged stocks are left out by both backends
+    unchanged = rng.random((ny, nx)) < 0.1
+    stocks[1, unchanged] = stocks[0, unchanged]
+
+    return xr.Dataset({'stocks': (('time', 'y', 'x'), stocks), 'land-cover': (('time', 'y', 'x'), land_cover)},
+                      coords={'y': 10. - 0.25 * np.arange(ny), 'x': 30. + 0.25 * np.arange(nx)}).chunk(
+        {'y': 16, 'x': 16})
+
+
+def _assert_same(expected, actual):
+    assert expected.keys() == actual.keys()
+    for lc_2018, values in expected.items():
+        assert values.keys() == actual[lc_2018].keys()
+        for lc_2000, value in values.items():
+            assert actual[lc_2018][lc_2000] == pytest.approx(value, rel=1e-6)
+
+
+@pytest.mark.parametrize('bbox', [(30., 0.5, 42.25, 10.), (31.1, 3.2, 36.9, 8.8), (40., 1., 41., 2.)])
+def test_ee_grouped_reducer_matches_local(ds, bbox):
+    local = LocalZarrBackend(ds).get_data(bbox)
+    remote = EEGroupedReducerBackend(client=FakeClient(ds)).get_data(bbox)
+
+    assert local
+    _assert_same(local, remote)
+
+
+def test_no_data_falls_in_the_no_data_group(ds):
+    ds = ds.load()
+    ds['land-cover'][0, :10] = 0
+    bbox = (30., 0.5, 42.25, 10.)
+
+    local = LocalZarrBackend(ds).get_data(bbox)
+    remote = EEGroupedReducerBackend(client=FakeClient(ds)).get_data(bbox)
+
+    assert any('No Data' in values for values in local.values())
+    _assert_same(local, remote)
+
+
+def test_select_backend_by_area_in_km2():
+    # The same 10 x 10 degrees box is larger than the threshold at the equator only
+    assert select_backend((0., -5., 10., 5.), local='local', remote='remote',
+                          remote_min_area_km2=1_000_000.) == 'remote'
+    assert select_backend((0., 70., 10., 80.), local='local', remote='remote',
+                          remote_min_area_km2=1_000_000.) == 'local'
+    assert select_backend((0., 0., 1., 1.), local='local', remote='remote') == 'local'
+    assert select_backend((0., 0., 50., 50.), local='local', remote='remote', index='index') == 'index'
+    assert select_backend((0., 0., 50., 50.), local='local', remote='remote', index='index',
+                          polygon=True) == 'remote'
+    assert REMOTE_MIN_AREA_KM2 > 0
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class BboxOnly(ComputeBackend):
+        def get_data(self, bbox):
+            return {}
+
+    with pytest.raises(TypeError):
+        BboxOnly()
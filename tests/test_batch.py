@@ -0,0 +1,43 @@
+import json
+
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+from shapely.geometry import box
+
+from soils_revealed.batch import group_by_chunk, read_features
+from soils_revealed.scheduling import plan
+
+
+def _dataset(stocks_chunks, land_cover_chunks, size=40):
+    coords = {'time': [2000, 2018], 'y': 10 - 0.5 - np.arange(size), 'x': 0.5 + np.arange(size)}
+    return xr.Dataset({'stocks': (('time', 'y', 'x'), da.zeros((2, size, size), chunks=(1,) + stocks_chunks)),
+                       'land-cover': (('time', 'y', 'x'), da.zeros((2, size, size), dtype=np.uint8,
+                                                                   chunks=(1,) + land_cover_chunks))},
+                      coords=coords)
+
+
+def test_groups_follow_the_plan_chunks():
+    ds = _dataset((10, 10), (20, 20))
+    features = [(str(n), box(x, 10 - y - 2, x + 2, 10 - y)) for n, (y, x) in enumerate([(1, 1), (12, 1), (25, 31)])]
+
+    groups = group_by_chunk(ds, features, chunks_per_group=1)
+
+    # Every group reads its own plan chunk, no chunk is split between groups
+    chunks = [set(plan(ds, group).chunk_regions) for group in groups.values()]
+    assert all(len(group_chunks) == 1 for group_chunks in chunks)
+    assert len(set.union(*chunks)) == len(groups)
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    path = tmp_path / 'features.geojson'
+    geometry = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'id': 'a'}, 'geometry': geometry},
+        {'type': 'Feature', 'properties': {'id': 'b'}, 'geometry': geometry},
+        {'type': 'Feature', 'properties': {'id': 'a'}, 'geometry': geometry},
+    ]}))
+
+    with pytest.raises(ValueError, match="a"):
+        read_features(str(path))
@@ -0,0 +1,132 @@
+import pickle
+
+import numpy as np
+import pytest
+import xarray as xr
+import zarr
+
+from soils_revealed.chunk_cache import ChunkCacheConfig, DiskLRU
+
+
+class CountingStore(zarr.DirectoryStore):
+    """
+    Local store counting the requests that would go to S3.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.gets = []
+        self.contains = []
+
+    def __getitem__(self, key):
+        self.gets.append(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.contains.append(key)
+        return super().__contains__(key)
+
+    def reset(self):
+        self.gets.clear()
+        self.contains.clear()
+
+
+def _chunk_keys(keys):
+    return [key for key in keys if not key.rsplit('/', 1)[-1].startswith('.')]
+
+
+@pytest.fixture
+def source(tmp_path):
+    ds = xr.Dataset({'stocks': (('y', 'x'), np.arange(64 * 80, dtype=np.float32).reshape(64, 80))})
+    ds.chunk({'y': 16, 'x': 20}).to_zarr(str(tmp_path / 'source.zarr'), consolidated=True)
+
+    return CountingStore(str(tmp_path / 'source.zarr')), ds
+
+
+def test_reads_through_memory(source):
+    store, ds = source
+    cache = ChunkCacheConfig(memory_bytes=2 ** 20).wrap(store, namespace='source')
+
+    first = xr.open_zarr(cache, consolidated=True)['stocks'].values
+    store.reset()
+    second = xr.open_zarr(cache, consolidated=True)['stocks'].values
+
+    np.testing.assert_array_equal(first, ds['stocks'].values)
+    np.testing.assert_array_equal(second, ds['stocks'].values)
+    assert _chunk_keys(store.gets) == [] and _chunk_keys(store.contains) == []
+    assert cache.stats()['memory_hits'] >= 16
+
+
+def test_disk_warm_cache_does_not_touch_the_store(source, tmp_path):
+    store, ds = source
+    xr.open_zarr(ChunkCacheConfig(memory_bytes=0, disk_path=str(tmp_path / 'cache')).wrap(store, 'source'),
+                 consolidated=True)['stocks'].values
+
+    # A new process: empty memory tier, same disk directory
+    store.reset()
+    config = ChunkCacheConfig(memory_bytes=0, disk_path=str(tmp_path / 'cache'))
+    values = xr.open_zarr(config.wrap(store, 'source'), consolidated=True)['stocks'].values
+
+    np.testing.assert_array_equal(values, ds['stocks'].values)
+    assert store.gets == [] and store.contains == []
+    assert config.stats()['disk_hits'] > 0 and config.stats()['misses'] == 0
+
+
+def test_misses_are_fetched_once_in_a_batch(source):
+    store, _ = source
+    cache = ChunkCacheConfig().wrap(store, namespace='source')
+    keys = [f'stocks/{row}.{column}' for row in range(4) for column in range(4)]
+
+    values = cache.getitems(keys + ['stocks/9.9'], contexts={})
+
+    assert sorted(values) == sorted(keys)
+    assert sorted(store.gets) == sorted(keys + ['stocks/9.9'])
+    assert cache.getitems(keys, contexts={}).keys() == values.keys()
+    assert cache.getitems([], contexts={}) == {}
+    assert cache.stats()['misses'] == len(keys) and cache.stats()['memory_hits'] == len(keys)
+
+
+def test_budgets_are_shared_by_all_stores(tmp_path):
+    config = ChunkCacheConfig(memory_bytes=300_000, disk_path=str(tmp_path / 'cache'), disk_bytes=600_000)
+    for name in 'abc':
+        path = str(tmp_path / f'{name}.zarr')
+        xr.Dataset({'v': (('y', 'x'), np.random.rand(200, 200))}).chunk({'y': 50, 'x': 50}).to_zarr(
+            path, encoding={'v': {'compressor': None}}, consolidated=True)
+        xr.open_zarr(config.wrap(zarr.DirectoryStore(path), namespace=name), consolidated=True)['v'].values
+
+    stats = config.stats()
+    assert stats['memory_bytes'] <= 300_000 and stats['disk_bytes'] <= 600_000
+    assert set(stats['namespaces']) == {'a', 'b', 'c'}
+    assert stats['misses'] == sum(counts['misses'] for counts in stats['namespaces'].values())
+
+
+def test_writes_invalidate_the_tiers(source, tmp_path):
+    store, _ = source
+    cache = ChunkCacheConfig(disk_path=str(tmp_path / 'cache')).wrap(store, namespace='source')
+    before = cache['stocks/0.0']
+
+    cache['stocks/0.0'] = b'changed'
+
+    assert before != b'changed' and cache['stocks/0.0'] == b'changed'
+
+
+def test_config_pickles_its_settings_only(source):
+    store, _ = source
+    config = ChunkCacheConfig(memory_bytes=1024)
+    config.wrap(store)['stocks/0.0']
+
+    copy = pickle.loads(pickle.dumps(config))
+
+    assert copy == config
+    assert copy.caches == [] and copy.stats()['misses'] == 0
+
+
+def test_disk_lru_evicts_and_recovers(tmp_path):
+    disk = DiskLRU(str(tmp_path), max_bytes=25)
+    for key in 'abc':
+        disk.put(key, key.encode() * 10)
+    disk.get('b')
+    disk.put('d', b'd' * 10)
+
+    assert 'a' not in disk and 'c' not in disk and disk.get('b') == b'b' * 10
+    assert DiskLRU(str(tmp_path), max_bytes=25).size == disk.size == 20
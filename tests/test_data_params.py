@@ -0,0 +1,90 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from soils_revealed import data_params
+
+TIMES = pd.to_datetime(['2000-12-31', '2010-12-31', '2018-12-31']).as_unit('ns')
+
+
+def _store(dataset, group=None):
+    coords = {'y': [0.5, -0.5], 'x': [0.5, 1.5]}
+    if dataset == 'land-cover':
+        return xr.Dataset({'land-cover': (('time', 'y', 'x'), np.full((3, 2, 2), 10, dtype=np.uint8))},
+                          coords={'time': TIMES, **coords})
+
+    return xr.Dataset({'stocks': (('time', 'y', 'x'), np.ones((3, 2, 2))),
+                       'depth_bnds': (('depth', 'nv'), [[0., 30.]])},
+                      coords={'time': TIMES, 'depth': ['0-30'], **coords})
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    opened = []
+
+    def read_zarr_from_s3(access_key_id, secret_accsess_key, dataset, group=None, s3=None, cache=None):
+        opened.append((dataset, group))
+        return _store(dataset, group)
+
+    monkeypatch.setattr(data_params, 'read_zarr_from_s3', read_zarr_from_s3)
+    monkeypatch.setattr(data_params, '_providers', {})
+    provider = data_params.get_provider('key', 'secret')
+    monkeypatch.setattr(provider, 's3', SimpleNamespace(exists=lambda path: False))
+
+    return opened
+
+
+def _call(function, timeout=10):
+    # Run in a thread so that a deadlock fails the test instead of hanging it
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=function()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{function} did not return within {timeout}s"
+
+    return result['value']
+
+
+def test_read_ds_through_provider(opened):
+    ds = _call(lambda: data_params.read_ds('key', 'secret'))
+
+    assert set(ds.data_vars) == {'stocks', 'land-cover'}
+    assert ds.sizes['time'] == 2
+    assert sorted(opened) == [('global-dataset', 'recent'), ('land-cover', None)]
+
+
+def test_read_ds_is_cached(opened):
+    first = _call(lambda: data_params.read_ds('key', 'secret'))
+    second = _call(lambda: data_params.read_ds('key', 'secret'))
+    provider = data_params.get_provider('key', 'secret')
+
+    assert first is second
+    assert len(opened) == 2
+    assert provider.stats()['hits'] == 1
+
+
+def test_other_modes_share_the_opened_stores(opened):
+    timeseries = _call(lambda: data_params.read_timeseries_ds('key', 'secret'))
+    depth = _call(lambda: data_params.read_depth_ds('key', 'secret'))
+
+    assert timeseries.sizes['time'] == 3 and timeseries.sizes['lc_time'] == 2
+    assert 'depth' in depth.dims
+    assert len(opened) == 2
+
+
+def test_concurrent_first_requests_open_once(opened):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(data_params.read_ds('key', 'secret')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(results) == 8
+    assert all(ds is results[0] for ds in results)
+    assert len(opened) == 2
@@ -0,0 +1,90 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from cachetools import TTLCache
+
+from soils_revealed import maps
+from soils_revealed.maps import GEELayer, GEELayersMixin, resolve_tile_urls
+
+
+class FakeImage:
+    """
+    Stands in for `ee.Image`: serializes locally, `getMapId` is the Earth Engine round trip.
+    """
+
+    def __init__(self, name, barrier=None):
+        self.name = name
+        self.barrier = barrier
+        self.map_id_calls = 0
+
+    def serialize(self):
+        return f'{{"image": "{self.name}"}}'
+
+    def sldStyle(self, sld_interval):
+        return SimpleNamespace(getMapId=lambda: self._map_id(sld_interval))
+
+    def _map_id(self, sld_interval):
+        self.map_id_calls += 1
+        if self.barrier is not None:
+            # Only returns once every layer is being resolved at the same time
+            self.barrier.wait()
+        return {'tile_fetcher': SimpleNamespace(url_format=f'https://tiles/{self.name}/{len(sld_interval)}/{{z}}')}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.)
+    monkeypatch.setattr(maps, '_tile_urls', TTLCache(maxsize=256, ttl=maps.TILE_URL_TTL, timer=lambda: clock.now))
+    return clock
+
+
+def test_resolves_layers_concurrently_in_order(clock):
+    barrier = threading.Barrier(3, timeout=5)
+    layers = [GEELayer(image=FakeImage(name, barrier), sld_interval='<sld/>', name=name) for name in 'abc']
+
+    assert resolve_tile_urls(layers) == [f'https://tiles/{name}/6/{{z}}' for name in 'abc']
+
+
+def test_cached_urls_skip_earth_engine(clock):
+    image = FakeImage('a')
+    layer = GEELayer(image=image, sld_interval='<sld/>', name='a')
+
+    first = resolve_tile_urls([layer])
+    # Same image and style in a new layer object, as built on every Streamlit rerun
+    second = resolve_tile_urls([GEELayer(image=FakeImage('a'), sld_interval='<sld/>', name='a')])
+
+    assert first == second and image.map_id_calls == 1
+
+
+def test_style_is_part_of_the_key(clock):
+    image = FakeImage('a')
+    urls = resolve_tile_urls([GEELayer(image, '<sld/>', 'a'), GEELayer(image, '<other-sld/>', 'a')])
+
+    assert urls[0] != urls[1] and image.map_id_calls == 2
+
+
+def test_urls_expire(clock):
+    image = FakeImage('a')
+    layer = GEELayer(image=image, sld_interval='<sld/>', name='a')
+
+    resolve_tile_urls([layer])
+    clock.now += maps.TILE_URL_TTL + 1
+    resolve_tile_urls([layer])
+
+    assert image.map_id_calls == 2
+
+
+def test_add_gee_layers_adds_tile_layers_in_order(clock):
+    class FakeMap(GEELayersMixin):
+        def __init__(self):
+            self.layers = []
+
+        def add_tile_layer(self, tiles_url, name):
+            self.layers.append((name, tiles_url))
+
+    fake_map = FakeMap()
+    fake_map.add_gee_layers([GEELayer(FakeImage(name), '<sld/>', name) for name in 'abc'])
+    fake_map.add_gee_layer(FakeImage('d'), '<sld/>', 'd')
+
+    assert [name for name, _ in fake_map.layers] == ['a', 'b', 'c', 'd']
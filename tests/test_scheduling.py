@@ -0,0 +1,48 @@
+import dask.array as da
+import numpy as np
+import xarray as xr
+from shapely.geometry import Polygon, box
+
+from soils_revealed.scheduling import execute, plan
+from soils_revealed.transitions import transition_matrix
+
+SIZE = 1000
+
+
+def _dataset(stocks_chunks=100, land_cover_chunks=128, seed=0):
+    rng = np.random.default_rng(seed)
+    stocks = rng.normal(50., 10., (2, SIZE, SIZE))
+    land_cover = rng.choice(np.array([10, 30, 50, 190], dtype=np.uint8), (2, SIZE, SIZE))
+    coords = {'time': [2000, 2018], 'y': SIZE / 2 - 0.5 - np.arange(SIZE), 'x': 0.5 + np.arange(SIZE)}
+
+    return xr.Dataset({'stocks': (('time', 'y', 'x'), da.from_array(stocks, chunks=(1, stocks_chunks, stocks_chunks))),
+                       'land-cover': (('time', 'y', 'x'), da.from_array(land_cover, chunks=(1, land_cover_chunks,
+                                                                                             land_cover_chunks)))},
+                      coords=coords)
+
+
+def _expected(ds, region):
+    stocks = ds['stocks'].values[:, region.y, region.x]
+    land_cover = ds['land-cover'].values[:, region.y, region.x]
+    return transition_matrix(stocks[0], stocks[1], land_cover[0], land_cover[1], mask=region.mask)
+
+
+def test_mixed_chunks_read_only_the_windows_of_the_regions():
+    ds = _dataset()
+    # Pixel windows [10, 20) x [10, 30) and [60, 80) x [40, 50), plus a triangle around the middle
+    features = [('a', box(10, 480, 30, 490)), ('b', box(40, 420, 50, 440)),
+                ('c', Polygon([(450, 50), (550, 50), (500, -50)]))]
+
+    chunk_plan = plan(ds, features)
+    results, metrics = execute(ds, chunk_plan, max_workers=2)
+
+    # Not collapsed to the whole dimension when the chunk sizes do not nest
+    assert chunk_plan.row_bounds.tolist() == list(range(0, SIZE + 1, 100))
+    for region in chunk_plan.regions:
+        for expected, actual in zip(_expected(ds, region), results[region.id]):
+            np.testing.assert_allclose(actual, expected)
+
+    # a and b share one stocks and one land cover chunk, c spans 2 x 2 of each
+    assert metrics.naive_chunk_reads == 2 + 2 + 8
+    assert metrics.chunks_read == 2 + 8
+    assert metrics.chunks_saved == 2
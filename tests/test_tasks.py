@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from soils_revealed.tasks import ExportTaskMonitor
+
+
+class FakeBackend:
+    """
+    Task backend whose tasks go through scripted states, one per status request.
+    """
+
+    def __init__(self, scripts):
+        self.scripts = {name: list(states) for name, states in scripts.items()}
+        self.started = []
+        self.cancelled = []
+        self.status_requests = 0
+        self.max_running = 0
+
+    def start(self, task):
+        self.started.append(task.id)
+
+    def statuses(self, tasks):
+        self.status_requests += 1
+        self.max_running = max(self.max_running, len(tasks))
+        statuses = []
+        for task in tasks:
+            script = self.scripts[task.id]
+            state = script.pop(0) if len(script) > 1 else script[0]
+            statuses.append({'state': state, 'error_message': 'Export too large' if state == 'FAILED' else None})
+
+        return statuses
+
+    def cancel(self, task):
+        self.cancelled.append(task.id)
+
+
+def _tasks(names):
+    return {name: SimpleNamespace(id=name) for name in names}
+
+
+def test_runs_every_task_to_completion():
+    backend = FakeBackend({name: ['RUNNING', 'COMPLETED'] for name in 'abc'})
+    monitor = ExportTaskMonitor(_tasks('abc'), backend=backend)
+    sleeps, fractions = [], []
+
+    progress = monitor.run(progress_callback=lambda progress: fractions.append(progress.fraction),
+                           sleep=sleeps.append)
+
+    assert progress.finished and not progress.failed and progress.completed == 3
+    assert backend.started == ['a', 'b', 'c'] and backend.cancelled == []
+    assert fractions[-1] == 1. and fractions == sorted(fractions)
+    # One batched status request per poll
+    assert backend.status_requests == len(fractions)
+
+
+def test_failure_cancels_the_other_tasks():
+    backend = FakeBackend({'a': ['RUNNING', 'FAILED'], 'b': ['RUNNING'], 'c': ['RUNNING']})
+    monitor = ExportTaskMonitor(_tasks('abc'), backend=backend, max_running=2)
+
+    progress = monitor.run(sleep=lambda delay: None)
+
+    assert progress.failed and progress.finished
+    assert progress.errors == {'a': 'Export too large'}
+    assert backend.cancelled == ['b']
+    # c never started, it is cancelled from the queue
+    assert backend.started == ['a', 'b'] and progress.states['c'] == 'CANCELLED'
+
+
+def test_at_most_max_running_tasks_at_once():
+    backend = FakeBackend({name: ['RUNNING', 'RUNNING', 'COMPLETED'] for name in 'abcdef'})
+    monitor = ExportTaskMonitor(_tasks('abcdef'), backend=backend, max_running=2)
+
+    progress = monitor.run(sleep=lambda delay: None)
+
+    assert progress.completed == 6 and backend.max_running == 2
+    assert backend.started == list('abcdef')
+
+
+def test_delay_backs_off_while_nothing_changes():
+    backend = FakeBackend({'a': ['RUNNING'] * 5 + ['COMPLETED']})
+    monitor = ExportTaskMonitor(_tasks('a'), backend=backend, initial_delay=1., max_delay=4., backoff=2.)
+    sleeps = []
+
+    monitor.run(sleep=sleeps.append)
+
+    assert sleeps == [1., 2., 4., 4., 4.]
+
+
+def test_run_async():
+    backend = FakeBackend({name: ['RUNNING', 'COMPLETED'] for name in 'ab'})
+    monitor = ExportTaskMonitor(_tasks('ab'), backend=backend, initial_delay=0.)
+
+    progress = asyncio.run(monitor.run_async())
+
+    assert progress.completed == 2
@@ -0,0 +1,35 @@
+import numpy as np
+import xarray as xr
+
+from soils_revealed.area import bbox_area_km2, row_cell_areas, selection_area_km2
+from soils_revealed.verification import selected_bbox_too_large
+
+RESOLUTION = 0.25
+
+
+def _grid():
+    return xr.Dataset(coords={'y': 60 - RESOLUTION / 2 - RESOLUTION * np.arange(40),
+                              'x': 10 + RESOLUTION / 2 + RESOLUTION * np.arange(40)})
+
+
+def _polygon(xmin, ymin, xmax, ymax):
+    return {'type': 'Polygon', 'coordinates': [[[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax],
+                                                [xmin, ymin]]]}
+
+
+def test_selection_area_sums_row_cell_areas():
+    ds = _grid()
+    # Pixel centres inside the bbox: rows 4..11, columns 0..3
+    bbox = (10., 57., 11., 59.)
+
+    assert np.isclose(selection_area_km2(ds, bbox), row_cell_areas(ds)[4:12].sum() * 4)
+    assert np.isclose(selection_area_km2(ds, bbox), bbox_area_km2(*bbox))
+
+
+def test_km2_check_uses_the_pixels_of_the_grid():
+    ds = _grid()
+    # Half a pixel wide, so it selects no pixel centre of the grid
+    geometry = _polygon(10.01, 57., 10.12, 59.)
+
+    assert selected_bbox_too_large(geometry, threshold=1., units='km2')
+    assert not selected_bbox_too_large(geometry, threshold=1., units='km2', ds=ds)